@@ -5,8 +5,8 @@
 功能: 实现队列和栈的数据结构
 """
 import collections
-import heapq
-from typing import Any, Callable, List, Tuple, Dict
+import numpy as np
+from typing import Any, Callable, List, Tuple, Dict, Optional, Iterable, Iterator, Set
 
 
 class FacilityQueue:
@@ -14,48 +14,329 @@ class FacilityQueue:
     设施排队队列
     使用collections.deque实现，支持快速的append和pop操作
     """
+    __slots__ = ("queue", "size")
+    
     def __init__(self):
         self.queue = collections.deque()
+        self.size = 0  # 队列长度，随append/pop维护，读取时无需方法调用
     
     def append(self, item: Any) -> None:
         """添加元素到队列尾部"""
         self.queue.append(item)
+        self.size += 1
+    
+    def extend(self, items: Iterable[Any]) -> None:
+        """批量添加元素到队列尾部（deque.extend单次C调用）"""
+        queue = self.queue
+        before = len(queue)
+        queue.extend(items)
+        self.size += len(queue) - before
     
     def pop(self) -> Any:
         """从队列头部移除并返回元素"""
         if not self.queue:
             return None
+        self.size -= 1
         return self.queue.popleft()
     
+    def drain_into(self, out: List[Any], n: int) -> int:
+        """
+        从队列头部取出最多n个元素，依次写入out的前若干个位置
+        参数:
+            out: 预分配的输出列表，长度不小于n
+            n: 最多取出的元素数量
+        返回:
+            实际取出的元素数量
+        """
+        popleft = self.queue.popleft
+        count = min(n, self.size)
+        for i in range(count):
+            out[i] = popleft()
+        self.size -= count
+        return count
+    
     def __len__(self) -> int:
         """返回队列长度"""
-        return len(self.queue)
+        return self.size
     
     def __iter__(self):
         """返回队列迭代器"""
         return iter(self.queue)
 
 
+class RingBuffer:
+    """
+    设施统计历史环形缓冲区（结构数组布局）
+    时间、排队人数、利用率、平均等待时间各占一个预分配的NumPy数组，
+    写满后覆盖最旧的数据，内存占用固定
+    """
+    __slots__ = ("t", "q", "u", "w", "head", "size")
+    
+    def __init__(self, capacity: int = 3600):
+        capacity = max(1, capacity)
+        # 时间戳数值较大，使用float64保证精度；统计值使用float32
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.q = np.zeros(capacity, dtype=np.float32)
+        self.u = np.zeros(capacity, dtype=np.float32)
+        self.w = np.zeros(capacity, dtype=np.float32)
+        self.head = 0  # 下一个写入位置
+        self.size = 0  # 当前样本数量
+    
+    @property
+    def capacity(self) -> int:
+        """缓冲区容量"""
+        return len(self.t)
+    
+    def push(self, t: float, q: float, u: float, w: float = 0.0) -> None:
+        """
+        写入一个采样点
+        参数:
+            t: 时间戳
+            q: 排队人数
+            u: 利用率
+            w: 平均等待时间
+        """
+        head = self.head
+        self.t[head] = t
+        self.q[head] = q
+        self.u[head] = u
+        self.w[head] = w
+        self.head = (head + 1) % len(self.t)
+        if self.size < len(self.t):
+            self.size += 1
+    
+    def view(self, field: str = "q") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        按时间顺序返回指定字段的历史数据
+        参数:
+            field: 字段名（q/u/w）
+        返回:
+            (时间数组, 数值数组)，未写满时为切片视图，不复制数据
+        """
+        values = getattr(self, field)
+        if self.size < len(self.t):
+            return self.t[:self.size], values[:self.size]
+        head = self.head
+        return (np.concatenate((self.t[head:], self.t[:head])),
+                np.concatenate((values[head:], values[:head])))
+    
+    def pairs(self, field: str = "q", chunk: int = 4096) -> Iterator[Tuple[float, float]]:
+        """
+        按时间顺序逐个生成指定字段的(时间, 数值)，供导出使用
+        按chunk条分段转换为Python数值，不复制整段历史
+        参数:
+            field: 字段名（q/u/w）
+            chunk: 每次转换的记录条数
+        返回:
+            (时间戳, 数值)元组迭代器
+        """
+        values = getattr(self, field)
+        if self.size < len(self.t):
+            segments = ((0, self.size),)
+        else:
+            segments = ((self.head, len(self.t)), (0, self.head))
+        for start, stop in segments:
+            for i in range(start, stop, chunk):
+                j = min(i + chunk, stop)
+                yield from zip(self.t[i:j].tolist(), values[i:j].tolist())
+    
+    def __len__(self) -> int:
+        """返回样本数量"""
+        return self.size
+
+
+class _HeapEvents:
+    """
+    带位置索引的二叉最小堆，元素为(time, event_id)
+    维护event_id -> 堆下标的映射，支持O(log N)调整已入堆事件的时间
+    下沉采用CPython Lib/heapq.py中的做法：总是沿较小的子节点一路下沉到叶子，
+    不做提前退出的比较，到达叶子后再上浮到正确位置
+    """
+    __slots__ = ("heap", "index")
+    
+    def __init__(self):
+        self.heap: List[Tuple[float, int]] = []
+        self.index: Dict[int, int] = {}  # event_id -> 堆下标
+    
+    def push(self, entry: Tuple[float, int]) -> None:
+        """添加元素"""
+        self.heap.append(entry)
+        self._sift_up(len(self.heap) - 1)
+    
+    def pop(self) -> Tuple[float, int]:
+        """移除并返回最小元素"""
+        heap = self.heap
+        last = heap.pop()
+        if not heap:
+            del self.index[last[1]]
+            return last
+        top = heap[0]
+        del self.index[top[1]]
+        heap[0] = last
+        self._sift_down(0)
+        return top
+    
+    def extend(self, entries: List[Tuple[float, int]]) -> None:
+        """批量追加元素后整体重建堆，O(N)"""
+        heap = self.heap
+        heap.extend(entries)
+        for pos in range(len(heap) // 2, len(heap)):
+            self.index[heap[pos][1]] = pos
+        for pos in reversed(range(len(heap) // 2)):
+            self._sift_down(pos)
+    
+    def reschedule(self, event_id: int, new_time: float) -> bool:
+        """
+        修改已入堆事件的时间
+        参数:
+            event_id: 事件ID
+            new_time: 新的事件时间
+        返回:
+            事件是否存在
+        """
+        pos = self.index.get(event_id)
+        if pos is None:
+            return False
+        old_entry = self.heap[pos]
+        new_entry = (new_time, event_id)
+        self.heap[pos] = new_entry
+        if new_entry < old_entry:
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+        return True
+    
+    def _sift_up(self, pos: int, startpos: int = 0) -> None:
+        """把pos处的元素上浮到正确位置（不越过startpos）"""
+        heap = self.heap
+        index = self.index
+        item = heap[pos]
+        while pos > startpos:
+            parentpos = (pos - 1) >> 1
+            parent = heap[parentpos]
+            if item < parent:
+                heap[pos] = parent
+                index[parent[1]] = pos
+                pos = parentpos
+                continue
+            break
+        heap[pos] = item
+        index[item[1]] = pos
+    
+    def _sift_down(self, pos: int) -> None:
+        """把pos处的元素沿较小子节点下沉到叶子，再上浮回正确位置"""
+        heap = self.heap
+        index = self.index
+        endpos = len(heap)
+        startpos = pos
+        item = heap[pos]
+        childpos = 2 * pos + 1
+        while childpos < endpos:
+            rightpos = childpos + 1
+            if rightpos < endpos and not heap[childpos] < heap[rightpos]:
+                childpos = rightpos
+            child = heap[childpos]
+            heap[pos] = child
+            index[child[1]] = pos
+            pos = childpos
+            childpos = 2 * pos + 1
+        heap[pos] = item
+        index[item[1]] = pos
+        self._sift_up(pos, startpos)
+    
+    def __len__(self) -> int:
+        """返回元素数量"""
+        return len(self.heap)
+
+
 class EventQueue:
     """
     事件优先级队列
-    使用heapq实现，按事件时间排序
+    使用带位置索引的二叉堆实现，按事件时间排序，支持修改和取消事件
+    堆中只保存(time, event_id)，事件类型和数据存放在_payload字典中，
+    使堆调整时比较的元组更短，且永远不会比较到data字典
+    取消事件采用惰性删除：只记录ID，弹出时跳过
     """
+    __slots__ = ("events", "event_id", "_payload", "_canceled")
+    
     def __init__(self):
-        self.events = []
+        self.events = _HeapEvents()
         self.event_id = 0  # 用于确保事件时间相同时的稳定排序
+        self._payload: Dict[int, Tuple[str, Dict[str, Any]]] = {}  # event_id -> (event_type, data)
+        self._canceled: Set[int] = set()  # 已取消但仍在堆中的事件ID
     
-    def push(self, time: float, event_type: str, data: Dict[str, Any]) -> None:
+    def push(self, time: float, event_type: str, data: Dict[str, Any]) -> int:
         """
         添加事件到优先级队列
         参数:
             time: 事件发生时间
             event_type: 事件类型
             data: 事件数据
+        返回:
+            事件ID，可用于reschedule
         """
-        # 使用(event_id, time, event_type, data)作为堆元素，确保相同时间的事件按添加顺序排序
-        heapq.heappush(self.events, (time, self.event_id, event_type, data))
+        # 使用(time, event_id)作为堆元素，确保相同时间的事件按添加顺序排序
+        event_id = self.event_id
+        self._payload[event_id] = (event_type, data)
+        self.events.push((time, event_id))
         self.event_id += 1
+        return event_id
+    
+    def extend(self, events: Iterable[Tuple[float, str, Dict[str, Any]]]) -> None:
+        """
+        批量添加事件，用于初始化大量事件（如设施开放计划、预定游客到达）
+        先整体追加再heapify，总代价O(N)，优于逐个push的O(N log N)
+        参数:
+            events: (time, event_type, data)元组的可迭代对象
+        """
+        start = self.event_id
+        items = []
+        for i, (time, event_type, data) in enumerate(events):
+            self._payload[start + i] = (event_type, data)
+            items.append((time, start + i))
+        self.event_id = start + len(items)
+        
+        self.events.extend(items)
+    
+    def reschedule(self, event_id: int, new_time: float) -> bool:
+        """
+        修改尚未发生的事件的时间
+        参数:
+            event_id: push返回的事件ID
+            new_time: 新的事件时间
+        返回:
+            是否修改成功（事件已弹出或已取消时返回False）
+        """
+        if event_id in self._canceled:
+            return False
+        return self.events.reschedule(event_id, new_time)
+    
+    def cancel(self, event_id: int) -> bool:
+        """
+        取消尚未发生的事件，O(1)
+        参数:
+            event_id: push返回的事件ID
+        返回:
+            是否取消成功（事件已弹出或已取消时返回False）
+        """
+        if event_id not in self._payload or event_id in self._canceled:
+            return False
+        self._canceled.add(event_id)
+        
+        # 已取消的事件超过堆中事件的一半时，过滤后重建堆
+        if len(self._canceled) > len(self.events) // 2:
+            self._compact()
+        return True
+    
+    def _compact(self) -> None:
+        """从堆中清除所有已取消的事件"""
+        canceled = self._canceled
+        entries = [entry for entry in self.events.heap if entry[1] not in canceled]
+        for event_id in canceled:
+            del self._payload[event_id]
+        canceled.clear()
+        self.events = _HeapEvents()
+        self.events.extend(entries)
     
     def pop(self) -> Tuple[float, str, Dict[str, Any]]:
         """
@@ -63,75 +344,223 @@ class EventQueue:
         返回:
             (time, event_type, data)元组
         """
-        if not self.events:
+        canceled = self._canceled
+        while self.events:
+            time, event_id = self.events.pop()
+            event_type, data = self._payload.pop(event_id)
+            if event_id in canceled:
+                # 跳过已取消的事件
+                canceled.discard(event_id)
+                continue
+            return time, event_type, data
+        return None
+    
+    def is_empty(self) -> bool:
+        """检查队列是否为空"""
+        return len(self.events) == len(self._canceled)
+    
+    def __len__(self) -> int:
+        """返回队列中的有效事件数量"""
+        return len(self.events) - len(self._canceled)
+
+
+class CalendarQueue:
+    """
+    日历队列（Brown, 1988）
+    将时间轴按bucket_width划分成环形排列的桶，事件按时间落入对应的桶，
+    时间单调推进的离散事件模拟中push/pop均摊O(1)；接口与EventQueue一致
+    """
+    __slots__ = ("_width", "_buckets", "_vbucket", "_size", "event_id", "_payload")
+    
+    def __init__(self, bucket_width: float = 1.0, bucket_count: int = 16):
+        self._width = bucket_width  # 每个桶覆盖的时间跨度
+        self._buckets: List[List[Tuple[float, int]]] = [[] for _ in range(bucket_count)]
+        self._vbucket = 0  # 当前扫描位置（未取模的虚拟桶编号）
+        self._size = 0
+        self.event_id = 0  # 用于确保事件时间相同时的稳定排序
+        self._payload: Dict[int, Tuple[str, Dict[str, Any]]] = {}  # event_id -> (event_type, data)
+    
+    def push(self, time: float, event_type: str, data: Dict[str, Any]) -> None:
+        """
+        添加事件到日历队列
+        参数:
+            time: 事件发生时间
+            event_type: 事件类型
+            data: 事件数据
+        """
+        event_id = self.event_id
+        self._payload[event_id] = (event_type, data)
+        self.event_id += 1
+        
+        vbucket = int(time // self._width)
+        self._buckets[vbucket % len(self._buckets)].append((time, event_id))
+        self._size += 1
+        # 早于当前扫描位置的事件，需要把扫描位置回退
+        if vbucket < self._vbucket:
+            self._vbucket = vbucket
+        
+        # 平均每个桶超过2个事件时扩容
+        if self._size > 2 * len(self._buckets):
+            self._resize(2 * len(self._buckets))
+    
+    def pop(self) -> Tuple[float, str, Dict[str, Any]]:
+        """
+        移除并返回最早发生的事件
+        返回:
+            (time, event_type, data)元组
+        """
+        if not self._size:
             return None
-        time, _, event_type, data = heapq.heappop(self.events)
+        
+        buckets = self._buckets
+        count = len(buckets)
+        width = self._width
+        vbucket = self._vbucket
+        entry = None
+        # 从当前桶开始向后扫描一整轮，找到落在本轮时间范围内的最早事件
+        for _ in range(count):
+            bucket = buckets[vbucket % count]
+            if bucket:
+                candidate = min(bucket)
+                # 与push使用同一公式判断是否属于本轮，避免浮点误差
+                if candidate[0] // width <= vbucket:
+                    entry = candidate
+                    break
+            vbucket += 1
+        
+        if entry is None:
+            # 事件过于稀疏，一整轮都没有命中，直接查找全局最早事件
+            entry = min(min(bucket) for bucket in buckets if bucket)
+            vbucket = int(entry[0] // width)
+        
+        buckets[vbucket % count].remove(entry)
+        self._vbucket = vbucket
+        self._size -= 1
+        
+        time, event_id = entry
+        event_type, data = self._payload.pop(event_id)
         return time, event_type, data
     
+    def _resize(self, bucket_count: int) -> None:
+        """
+        调整桶的数量，并根据最早的若干事件的平均间隔重新估算桶宽
+        参数:
+            bucket_count: 新的桶数量
+        """
+        entries = [entry for bucket in self._buckets for entry in bucket]
+        entries.sort()
+        
+        # Brown建议的桶宽：取前若干事件平均间隔的3倍
+        sample = entries[:25]
+        if len(sample) > 1:
+            gap = (sample[-1][0] - sample[0][0]) / (len(sample) - 1)
+            if gap > 0:
+                self._width = 3 * gap
+        
+        self._buckets = [[] for _ in range(bucket_count)]
+        for entry in entries:
+            self._buckets[int(entry[0] // self._width) % bucket_count].append(entry)
+        self._vbucket = int(entries[0][0] // self._width) if entries else 0
+    
     def is_empty(self) -> bool:
         """检查队列是否为空"""
-        return len(self.events) == 0
+        return self._size == 0
     
     def __len__(self) -> int:
         """返回队列中的事件数量"""
-        return len(self.events)
+        return self._size
 
 
 class PlanStack:
     """
     游客行程单栈
-    使用list实现，支持append和pop操作
+    使用deque实现，栈顶在左端，按从栈顶到栈底的顺序遍历即为剩余行程
     """
+    __slots__ = ("stack",)
+    
     def __init__(self):
-        self.stack = []
+        self.stack = collections.deque()
     
     def push(self, item: str) -> None:
         """添加元素到栈顶"""
-        self.stack.append(item)
+        self.stack.appendleft(item)
+    
+    def load(self, items: Iterable[str]) -> None:
+        """
+        一次性载入整个行程，替换栈中原有元素
+        参数:
+            items: 按访问顺序排列的元素，第一个元素位于栈顶
+        """
+        self.stack = collections.deque(items)
     
     def pop(self) -> str:
         """从栈顶移除并返回元素"""
         if not self.stack:
             return None
-        return self.stack.pop()
+        return self.stack.popleft()
     
     def peek(self) -> str:
         """查看栈顶元素但不移除"""
         if not self.stack:
             return None
-        return self.stack[-1]
+        return self.stack[0]
     
     def is_empty(self) -> bool:
         """检查栈是否为空"""
         return len(self.stack) == 0
     
+    def __iter__(self) -> Iterator[str]:
+        """从栈顶到栈底遍历元素"""
+        return iter(self.stack)
+    
     def __len__(self) -> int:
         """返回栈的长度"""
         return len(self.stack)
 
 
+# 数据形式的命令：kind为命令类型，payload为命令参数，由CommandStack的处理函数表执行
+Command = collections.namedtuple("Command", "kind payload")
+
+
 class CommandStack:
     """
     命令栈，用于撤销/重做操作
+    撤销操作和重做操作分别存放在两组并列的deque中，避免每次操作分配元组
+    操作可以是可调用对象，也可以是Command，后者按kind分派到handlers中的处理函数
     """
-    def __init__(self, max_size: int = 5):
-        self.undo_stack = []  # 撤销栈
-        self.redo_stack = []  # 重做栈
+    __slots__ = ("undo_u", "undo_r", "redo_u", "redo_r", "max_size", "handlers")
+    
+    def __init__(self, max_size: int = 5,
+                 handlers: Optional[Dict[str, Callable[[Any], None]]] = None):
+        # 撤销栈：undo_u存撤销函数，undo_r存对应的重做函数
+        # 超出max_size时deque自动丢弃最旧的记录（O(1)）
+        self.undo_u = collections.deque(maxlen=max_size)
+        self.undo_r = collections.deque(maxlen=max_size)
+        # 重做栈：redo_u存撤销函数，redo_r存对应的重做函数
+        self.redo_u = collections.deque()
+        self.redo_r = collections.deque()
         self.max_size = max_size  # 最大历史记录数
+        self.handlers = handlers if handlers is not None else {}  # 命令类型 -> 处理函数
+    
+    def _execute(self, action: Any) -> None:
+        """执行一个操作：Command按kind分派到处理函数，其他可调用对象直接调用"""
+        if isinstance(action, Command):
+            self.handlers[action.kind](action.payload)
+        else:
+            action()
     
-    def push(self, undo_func: Callable, redo_func: Callable) -> None:
+    def push(self, undo_func: Any, redo_func: Any) -> None:
         """
         添加操作到撤销栈
         参数:
-            undo_func: 撤销函数
-            redo_func: 重做函数
+            undo_func: 撤销操作（可调用对象或Command）
+            redo_func: 重做操作（可调用对象或Command）
         """
-        self.undo_stack.append((undo_func, redo_func))
-        # 限制撤销栈大小
-        if len(self.undo_stack) > self.max_size:
-            self.undo_stack.pop(0)
+        self.undo_u.append(undo_func)
+        self.undo_r.append(redo_func)
         # 清空重做栈
-        self.redo_stack.clear()
+        self.redo_u.clear()
+        self.redo_r.clear()
     
     def undo(self) -> bool:
         """
@@ -139,11 +568,14 @@ class CommandStack:
         返回:
             是否成功撤销
         """
-        if not self.undo_stack:
+        if not self.undo_u:
             return False
-        undo_func, redo_func = self.undo_stack.pop()
-        undo_func()
-        self.redo_stack.append((undo_func, redo_func))
+        # 两个deque先同时弹出，处理函数抛出异常时也不会错位
+        undo_func = self.undo_u.pop()
+        redo_func = self.undo_r.pop()
+        self._execute(undo_func)
+        self.redo_u.append(undo_func)
+        self.redo_r.append(redo_func)
         return True
     
     def redo(self) -> bool:
@@ -152,17 +584,20 @@ class CommandStack:
         返回:
             是否成功重做
         """
-        if not self.redo_stack:
+        if not self.redo_r:
             return False
-        undo_func, redo_func = self.redo_stack.pop()
-        redo_func()
-        self.undo_stack.append((undo_func, redo_func))
+        # 两个deque先同时弹出，处理函数抛出异常时也不会错位
+        undo_func = self.redo_u.pop()
+        redo_func = self.redo_r.pop()
+        self._execute(redo_func)
+        self.undo_u.append(undo_func)
+        self.undo_r.append(redo_func)
         return True
     
     def can_undo(self) -> bool:
         """检查是否可以撤销"""
-        return len(self.undo_stack) > 0
+        return len(self.undo_u) > 0
     
     def can_redo(self) -> bool:
         """检查是否可以重做"""
-        return len(self.redo_stack) > 0
\ No newline at end of file
+        return len(self.redo_r) > 0
\ No newline at end of file
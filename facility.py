@@ -4,17 +4,112 @@
 创建时间: 2024-01
 功能: 定义Facility类，包含排队队列、运行逻辑
 """
+import heapq
 import time
-from typing import List, Dict, Optional
+from dataclasses import dataclass, asdict, fields
+from types import MappingProxyType
+import numpy as np
+from typing import List, Dict, Optional, Tuple, Iterable, Mapping
 from data_structures import FacilityQueue
 
+# 每个设施保留的排队历史记录条数
+QUEUE_HISTORY_SIZE = 1000
+
+# 未知设施类型的默认信息（只读单例，避免每次查询分配空字典）
+_EMPTY = MappingProxyType({})
+
+class FacilityIndex:
+    """
+    设施名称到位索引的映射，游客用整数位掩码记录已访问的设施
+    每个乐园（GUI实例）各自持有一份，移除设施后释放的位索引优先复用，位掩码宽度不随历史设施数增长
+    """
+    __slots__ = ("bits", "_free")
+    
+    def __init__(self):
+        self.bits: Dict[str, int] = {}  # 设施名称 -> 位索引
+        self._free: List[int] = []  # 已释放的位索引（最小堆）
+    
+    def get(self, name: str) -> Optional[int]:
+        """获取设施名称对应的位索引，未登记时返回None"""
+        return self.bits.get(name)
+    
+    def register(self, name: str) -> int:
+        """
+        获取设施名称对应的位索引，首次出现的名称优先复用最小的已释放索引
+        参数:
+            name: 设施名称
+        返回:
+            位索引
+        """
+        index = self.bits.get(name)
+        if index is None:
+            index = heapq.heappop(self._free) if self._free else len(self.bits)
+            self.bits[name] = index
+        return index
+    
+    def release(self, name: str) -> Optional[int]:
+        """
+        释放设施名称占用的位索引，调用方需清除游客位掩码中的对应位
+        参数:
+            name: 设施名称
+        返回:
+            被释放的位索引，名称未登记时返回None
+        """
+        index = self.bits.pop(name, None)
+        if index is not None:
+            heapq.heappush(self._free, index)
+        return index
+    
+    def names(self, mask: int) -> List[str]:
+        """
+        获取位掩码中各个置位对应的设施名称
+        参数:
+            mask: 已访问设施的位掩码
+        返回:
+            设施名称列表
+        """
+        return [name for name, i in self.bits.items() if mask >> i & 1]
+    
+    def __len__(self) -> int:
+        """返回已登记的设施数量"""
+        return len(self.bits)
+
+
+@dataclass(slots=True)
+class FacilitySpec:
+    """
+    设施的持久化参数，与layout.json中的字段一一对应
+    """
+    name: str  # 设施名称
+    capacity: int  # 设施容量（每次可容纳人数）
+    run_time: int  # 单次运行时长（秒）
+    x: int  # 地图x坐标
+    y: int  # 地图y坐标
+    type: str = "默认"  # 设施类型
+    emoji: str = "🎪"  # 设施的emoji表示
+
+
+# FacilitySpec的字段名，从字典创建设施时用于过滤多余的键
+_SPEC_FIELDS = tuple(field.name for field in fields(FacilitySpec))
+
 
 class Facility:
     """
     设施类，代表乐园中的一个设施
+    持久化参数保存在spec（FacilitySpec）中，实例自身只保存模拟运行状态
+    使用__slots__，属性访问走槽位描述符，且每个实例不再携带__dict__
     """
+    __slots__ = (
+        "spec", "_cap_minus_one",
+        "waiting_queue", "is_running", "_riders", "_current_count", "run_start_time",
+        "total_run_time", "total_idle_time", "total_visitors_served",
+        "last_status_change_time",
+        "_qh_t", "_qh_n", "_qh_idx", "_qh_full", "_history_subscribers"
+    )
+    
     def __init__(self, name: str, capacity: int, run_time: int, x: int, y: int, 
-                 facility_type: str = "默认", emoji: str = "🎪"):
+                 facility_type: str = "默认", emoji: str = "🎪",
+                 now: Optional[float] = None):
         """
         初始化设施
         参数:
@@ -25,64 +120,178 @@ class Facility:
             y: 设施在地图上的y坐标
             facility_type: 设施类型
             emoji: 设施的emoji表示
+            now: 当前模拟时间（time.monotonic()时钟），为None时自动读取；
+                 批量创建设施时应传入同一个时间戳
+        """
+        self.spec = FacilitySpec(name, capacity, run_time, x, y, facility_type, emoji)
+        self._init_state(now)
+    
+    @classmethod
+    def from_spec(cls, spec: FacilitySpec, now: Optional[float] = None) -> 'Facility':
+        """
+        从设施参数创建设施对象
+        参数:
+            spec: 设施参数
+            now: 当前模拟时间
+        返回:
+            Facility对象
         """
-        self.name = name
-        self.capacity = capacity
-        self.run_time = run_time
-        self.x = x
-        self.y = y
-        self.type = facility_type
-        self.emoji = emoji
+        facility = cls.__new__(cls)
+        facility.spec = spec
+        facility._init_state(now)
+        return facility
+    
+    def _init_state(self, now: Optional[float]) -> None:
+        """
+        初始化模拟运行状态
+        参数:
+            now: 当前模拟时间，为None时自动读取
+        """
+        capacity = self.spec.capacity
+        self._cap_minus_one = capacity - 1  # 用于向上取整计算批次数
         
         # 排队队列
         self.waiting_queue = FacilityQueue()
         
         # 状态信息
         self.is_running = False
-        self.current_visitors = []  # 当前在设施中的游客
+        # 当前在设施中的游客，预分配capacity个槽位反复使用，前_current_count个有效
+        self._riders = [None] * capacity
+        self._current_count = 0
         self.run_start_time = 0  # 运行开始时间
         
         # 统计信息
         self.total_run_time = 0  # 总运行时间
         self.total_idle_time = 0  # 总空闲时间
         self.total_visitors_served = 0  # 总服务游客数
-        self.last_status_change_time = time.time()  # 最后状态改变时间
+        # 最后状态改变时间，使用单调时钟，避免系统时间跳变影响运行/空闲时间统计
+        self.last_status_change_time = time.monotonic() if now is None else now
         
         # 排队历史数据，用于图表显示
-        self.queue_history = []  # [(timestamp, queue_length)]
-        
+        # 时间戳和排队人数分别存放在两个环形缓冲区中，写满后覆盖最旧的记录
+        self._qh_t = np.empty(QUEUE_HISTORY_SIZE, dtype=np.float64)  # 时间戳
+        self._qh_n = np.empty(QUEUE_HISTORY_SIZE, dtype=np.int32)  # 排队人数
+        self._qh_idx = 0  # 下一条记录的写入位置
+        self._qh_full = False  # 缓冲区是否已写满一轮
+        self._history_subscribers = 0  # 正在显示排队历史的图表数量，为0时不记录
+    
+    @property
+    def name(self) -> str:
+        """设施名称"""
+        return self.spec.name
+    
+    @property
+    def capacity(self) -> int:
+        """设施容量"""
+        return self.spec.capacity
+    
+    @property
+    def run_time(self) -> int:
+        """单次运行时长（秒）"""
+        return self.spec.run_time
+    
+    @property
+    def type(self) -> str:
+        """设施类型"""
+        return self.spec.type
+    
+    @property
+    def emoji(self) -> str:
+        """设施的emoji表示"""
+        return self.spec.emoji
+    
+    @property
+    def x(self) -> int:
+        """地图x坐标"""
+        return self.spec.x
+    
+    @x.setter
+    def x(self, value: int) -> None:
+        self.spec.x = value
+    
+    @property
+    def y(self) -> int:
+        """地图y坐标"""
+        return self.spec.y
+    
+    @y.setter
+    def y(self, value: int) -> None:
+        self.spec.y = value
+    
     def update_status(self, current_time: float) -> None:
         """
         更新设施状态
         参数:
-            current_time: 当前时间
+            current_time: 当前时间（time.monotonic()时钟），同一时间步内所有设施应使用同一个值
         """
-        # 更新统计信息
+        # 更新统计信息（频繁读取的属性先缓存为局部变量）
         time_passed = current_time - self.last_status_change_time
-        if self.is_running:
+        running = self.is_running
+        if running:
             self.total_run_time += time_passed
         else:
             self.total_idle_time += time_passed
         # 更新最后状态改变时间，确保下次计算的是增量时间
         self.last_status_change_time = current_time
         
-        # 记录排队历史
-        self.queue_history.append((current_time, len(self.waiting_queue)))
-        # 保留最近1000条记录
-        if len(self.queue_history) > 1000:
-            self.queue_history.pop(0)
+        # 记录排队历史（仅在有图表订阅时）
+        if self._history_subscribers:
+            i = self._qh_idx
+            self._qh_t[i] = current_time
+            self._qh_n[i] = self.waiting_queue.size
+            self._qh_idx = (i + 1) % QUEUE_HISTORY_SIZE
+            self._qh_full = self._qh_full or self._qh_idx == 0
         
         # 检查运行是否结束
-        if self.is_running and current_time - self.run_start_time >= self.run_time:
+        if running and current_time - self.run_start_time >= self.spec.run_time:
             self._finish_run()
     
+    def subscribe_history(self) -> None:
+        """
+        订阅排队历史，图表显示该设施时调用
+        """
+        self._history_subscribers += 1
+    
+    def unsubscribe_history(self) -> None:
+        """
+        取消订阅排队历史，图表隐藏该设施时调用
+        """
+        if self._history_subscribers > 0:
+            self._history_subscribers -= 1
+    
+    @property
+    def queue_history(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        按时间顺序获取排队历史
+        返回:
+            (时间戳数组, 排队人数数组)元组
+        """
+        i = self._qh_idx
+        if not self._qh_full:
+            return self._qh_t[:i].copy(), self._qh_n[:i].copy()
+        return (np.concatenate((self._qh_t[i:], self._qh_t[:i])),
+                np.concatenate((self._qh_n[i:], self._qh_n[:i])))
+    
+    @property
+    def current_visitors(self) -> List:
+        """
+        获取当前在设施中的游客
+        返回:
+            游客列表
+        """
+        return self._riders[:self._current_count]
+    
     def _finish_run(self) -> None:
         """
         结束当前运行，释放游客
         """
         self.is_running = False
-        self.total_visitors_served += len(self.current_visitors)
-        self.current_visitors.clear()
+        self.total_visitors_served += self._current_count
+        # 清空已用槽位，不再持有离场游客的引用；列表本身留待下次运行复用
+        riders = self._riders
+        for i in range(self._current_count):
+            riders[i] = None
+        self._current_count = 0
     
     def start_run(self, current_time: float) -> bool:
         """
@@ -95,16 +304,10 @@ class Facility:
         if self.is_running:
             return False
         
-        # 从队列中取出最多capacity个游客
-        self.current_visitors = []
-        for _ in range(self.capacity):
-            visitor = self.waiting_queue.pop()
-            if visitor:
-                self.current_visitors.append(visitor)
-            else:
-                break
+        # 从队列中取出最多capacity个游客，写入预分配的槽位
+        self._current_count = self.waiting_queue.drain_into(self._riders, self.spec.capacity)
         
-        if self.current_visitors:
+        if self._current_count:
             self.is_running = True
             self.run_start_time = current_time
             return True
@@ -118,13 +321,21 @@ class Facility:
         """
         self.waiting_queue.append(visitor)
     
+    def add_visitors(self, visitors: Iterable) -> None:
+        """
+        批量添加游客到排队队列，用于开园、巡游散场等集中到达的场景
+        参数:
+            visitors: 游客对象的可迭代对象
+        """
+        self.waiting_queue.extend(visitors)
+    
     def get_queue_length(self) -> int:
         """
         获取当前排队长度
         返回:
             排队人数
         """
-        return len(self.waiting_queue)
+        return self.waiting_queue.size
     
     def get_utilization(self) -> float:
         """
@@ -143,13 +354,13 @@ class Facility:
         返回:
             等待时间（秒）
         """
-        queue_length = len(self.waiting_queue)
+        queue_length = self.waiting_queue.size
         if queue_length == 0:
             return 0.0
         
         # 简单估算：每批capacity个游客需要run_time秒
-        batches = (queue_length + self.capacity - 1) // self.capacity
-        return batches * self.run_time
+        spec = self.spec
+        return ((queue_length + self._cap_minus_one) // spec.capacity) * spec.run_time
     
     def move(self, x: int, y: int) -> None:
         """
@@ -158,8 +369,8 @@ class Facility:
             x: 新的x坐标
             y: 新的y坐标
         """
-        self.x = x
-        self.y = y
+        self.spec.x = x
+        self.spec.y = y
     
     def to_dict(self) -> Dict[str, any]:
         """
@@ -167,52 +378,39 @@ class Facility:
         返回:
             设施信息字典
         """
-        return {
-            "name": self.name,
-            "capacity": self.capacity,
-            "run_time": self.run_time,
-            "x": self.x,
-            "y": self.y,
-            "type": self.type,
-            "emoji": self.emoji
-        }
+        return asdict(self.spec)
     
     @classmethod
-    def from_dict(cls, data: Dict[str, any]) -> 'Facility':
+    def from_dict(cls, data: Dict[str, any], now: Optional[float] = None) -> 'Facility':
         """
         从字典创建设施对象
         参数:
             data: 设施信息字典
+            now: 当前模拟时间，批量加载时传入同一个时间戳
         返回:
             Facility对象
         """
-        return cls(
-            name=data["name"],
-            capacity=data["capacity"],
-            run_time=data["run_time"],
-            x=data["x"],
-            y=data["y"],
-            facility_type=data.get("type", "默认"),
-            emoji=data.get("emoji", "🎪")
-        )
+        # 只取FacilitySpec中定义的字段，忽略布局文件中多余的键
+        return cls.from_spec(FacilitySpec(**{key: data[key] for key in _SPEC_FIELDS if key in data}), now)
 
 
 class FacilityFactory:
     """
     设施工厂类，用于创建不同类型的设施
     """
-    # 设施类型配置
-    FACILITY_TYPES = {
-        "过山车": {"emoji": "🎢", "default_capacity": 20, "default_run_time": 120},
-        "摩天轮": {"emoji": "🎡", "default_capacity": 36, "default_run_time": 180},
-        "旋转木马": {"emoji": "🎠", "default_capacity": 16, "default_run_time": 90},
-        "碰碰车": {"emoji": "🚗", "default_capacity": 8, "default_run_time": 100},
-        "海盗船": {"emoji": "⛵", "default_capacity": 24, "default_run_time": 110}
-    }
+    # 设施类型配置（只读）
+    FACILITY_TYPES = MappingProxyType({
+        "过山车": MappingProxyType({"emoji": "🎢", "default_capacity": 20, "default_run_time": 120}),
+        "摩天轮": MappingProxyType({"emoji": "🎡", "default_capacity": 36, "default_run_time": 180}),
+        "旋转木马": MappingProxyType({"emoji": "🎠", "default_capacity": 16, "default_run_time": 90}),
+        "碰碰车": MappingProxyType({"emoji": "🚗", "default_capacity": 8, "default_run_time": 100}),
+        "海盗船": MappingProxyType({"emoji": "⛵", "default_capacity": 24, "default_run_time": 110})
+    })
     
     @classmethod
     def create_facility(cls, name: str, facility_type: str, capacity: int, 
-                        run_time: int, x: int, y: int) -> Facility:
+                        run_time: int, x: int, y: int,
+                        now: Optional[float] = None) -> Facility:
         """
         创建设施
         参数:
@@ -222,11 +420,11 @@ class FacilityFactory:
             run_time: 运行时长
             x: x坐标
             y: y坐标
+            now: 当前模拟时间，批量创建时传入同一个时间戳
         返回:
             Facility对象
         """
-        config = cls.FACILITY_TYPES.get(facility_type, {"emoji": "🎪"})
-        emoji = config.get("emoji", "🎪")
+        emoji = _EMOJI_BY_TYPE.get(facility_type, "🎪")
         
         return Facility(
             name=name,
@@ -235,7 +433,8 @@ class FacilityFactory:
             x=x,
             y=y,
             facility_type=facility_type,
-            emoji=emoji
+            emoji=emoji,
+            now=now
         )
     
     @classmethod
@@ -248,12 +447,16 @@ class FacilityFactory:
         return list(cls.FACILITY_TYPES.keys())
     
     @classmethod
-    def get_type_info(cls, facility_type: str) -> Dict[str, any]:
+    def get_type_info(cls, facility_type: str) -> Mapping[str, any]:
         """
         获取指定设施类型的默认信息
         参数:
             facility_type: 设施类型
         返回:
-            设施类型信息
+            设施类型信息（只读）
         """
-        return cls.FACILITY_TYPES.get(facility_type, {})
\ No newline at end of file
+        return cls.FACILITY_TYPES.get(facility_type, _EMPTY)
+
+
+# 设施类型 -> emoji，创建设施时只需一次字典查找
+_EMOJI_BY_TYPE = {k: v["emoji"] for k, v in FacilityFactory.FACILITY_TYPES.items()}
\ No newline at end of file
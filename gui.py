@@ -6,21 +6,35 @@
 """
 import tkinter as tk
 from tkinter import ttk, simpledialog, filedialog, messagebox
+import tkinter.font as tkfont
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.lines import Line2D
+from matplotlib.ticker import FuncFormatter
+from PIL import Image, ImageDraw, ImageFont, ImageTk
 import numpy as np
 import time
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Set, Tuple, Optional, Any
 
-from facility import Facility, FacilityFactory
-from visitor import Visitor, VisitorGenerator
-from data_structures import CommandStack, EventQueue
+from facility import Facility, FacilityFactory, FacilityIndex
+from visitor import Status, Visitor, VisitorGenerator
+from visitor_soa import VISITOR_IDLE, VISITOR_MOVING, tick_visitors
+from data_structures import Command, CommandStack, EventQueue, RingBuffer
 from utils import (
-    save_layout, load_layout, export_to_excel, generate_random_position,
-    calculate_distance, ensure_directory, get_available_colors,
+    save_layout, load_layout, export_to_excel, generate_random_position, get_free_cells,
+    calculate_distance, bin_waiting_times, ensure_directory, get_available_colors,
     get_utilization_color, get_queue_color, create_default_facilities
 )
 
+# 各平台常见的彩色emoji字体文件及渲染字号，按顺序尝试加载
+# 位图emoji字体只能按内置字号加载：Noto Color Emoji为109像素，Apple Color Emoji最大为160像素；
+# 矢量字体可用任意字号。渲染后统一缩小到显示尺寸
+EMOJI_FONTS = (
+    ("seguiemj.ttf", 109),
+    ("Apple Color Emoji.ttc", 160),
+    ("NotoColorEmoji.ttf", 109),
+)
+
 
 class ThemeParkGUI:
     """
@@ -44,15 +58,51 @@ class ThemeParkGUI:
         self.cell_size = 40
         self.facilities: Dict[str, Facility] = {}
         self.visitors: List[Visitor] = []
-        self.visitor_generator = VisitorGenerator()
-        self.command_stack = CommandStack(max_size=5)
+        # 设施位索引归本乐园所有，游客用它记录已访问的设施，移除设施时释放
+        self.facility_index = FacilityIndex()
+        self.visitor_generator = VisitorGenerator(facility_index=self.facility_index)
+        # 撤销/重做记录为Command数据，按类型分派到以下处理函数
+        self.command_stack = CommandStack(max_size=5, handlers={
+            "add": lambda data: self.add_facility(Facility.from_dict(data)),
+            "remove": self.remove_facility,
+            "move": self._apply_move_command,
+        })
         self.event_queue = EventQueue()
         
-        # 历史数据
-        self.queue_history: Dict[str, List] = {}
-        self.utilization_history: Dict[str, List] = {}
-        self.waiting_time_history: Dict[str, List] = {}
-        self.start_time = time.time()
+        # 历史数据：每个设施一个固定容量的环形缓冲区（时间/排队/利用率/等待时间）
+        self.history_capacity = 3600
+        self.history: Dict[str, RingBuffer] = {}
+        # 低频历史：每lowres_every个采样记录一次，高频缓冲区写满后用于显示全部时长
+        self.lowres_every = 10
+        self.history_lowres: Dict[str, RingBuffer] = {}
+        self._tick = 0  # 已执行的模拟步数
+        self.start_time = time.monotonic()  # 模拟时钟使用单调时钟
+        
+        # 地图画布元素，按设施名称/游客对象记录已创建的元素ID，重绘时只更新变化部分
+        self._facility_items: Dict[str, Dict[str, Any]] = {}
+        self._visitor_items: Dict[int, Dict[str, Any]] = {}
+        
+        # 游客目标/移动状态数组，游客位置在游客生成器的结构数组中
+        # 游客按生成顺序加入，第i行对应self.visitors[i]
+        # 地图坐标范围很小，坐标用int16保存，批量计算时内存带宽减半
+        self._vtgt = np.zeros((256, 2), dtype=np.int16)
+        self._vst = np.zeros(256, dtype=np.int8)
+        self._vtargets_dirty = False  # 游客目标或设施位置变化后需要重新整理目标数组
+        
+        # 网格坐标到设施名称的索引，点击和拖拽时直接查表
+        self._grid_index: Dict[Tuple[int, int], str] = {}
+        # 未被设施占用的格子，新增设施时直接从中抽取位置
+        self._free_cells: Set[Tuple[int, int]] = get_free_cells(self.map_size)
+        
+        # 地图重绘节流：只有状态变化（或超过最长间隔）时才重绘
+        self._map_dirty = True
+        self._last_render = 0.0
+        self.render_interval = 0.25  # 最长重绘间隔（秒）
+        self._queue_snapshot: Dict[str, int] = {}  # 上次检查时各设施的排队人数
+        
+        # 布局保存防抖
+        self._save_job = None
+        self.save_delay = 500  # 布局保存延迟（毫秒）
         
         # 拖拽相关
         self.dragging_facility = None
@@ -62,8 +112,7 @@ class ThemeParkGUI:
         
         # 图表相关
         self.current_chart_facility = "所有设施"
-        self.last_chart_update = 0
-        self.chart_update_interval = 1000  # 图表更新间隔（毫秒）
+        self.disp_skip = 10  # 每disp_skip个模拟步刷新一次图表（模拟步长100毫秒）
         self.heatmap_update_interval = 300000  # 热力图更新间隔（5分钟）
         
         # 创建界面
@@ -110,6 +159,24 @@ class ThemeParkGUI:
             "Loading.TFrame",
             background="white"
         )
+        
+        # 地图字体只创建一次，绘制时直接复用字体对象
+        self._emoji_font = tkfont.Font(family="SimHei", size=16)
+        self._name_font = tkfont.Font(family="SimHei", size=8)
+        self._queue_count_font = tkfont.Font(family="SimHei", size=10, weight="bold")
+        self._visitor_font = tkfont.Font(family="SimHei", size=14)
+        self._bubble_font = tkfont.Font(family="SimHei", size=8)  # 同时用于测量气泡文本宽度
+        self._bubble_widths: Dict[str, int] = {}  # 气泡文本 -> 像素宽度
+        
+        # 游客emoji位图缓存，每种emoji只渲染一次
+        self._emoji_images: Dict[str, Optional[ImageTk.PhotoImage]] = {}
+        self._emoji_pil_font = None
+        for font_file, render_size in EMOJI_FONTS:
+            try:
+                self._emoji_pil_font = ImageFont.truetype(font_file, render_size)
+                break
+            except OSError:
+                continue
     
     def create_ui(self):
         """
@@ -158,6 +225,9 @@ class ThemeParkGUI:
         )
         self.map_canvas.pack(fill=tk.BOTH, expand=True)
         
+        # 网格线只绘制一次，之后不再删除
+        self.draw_grid()
+        
         # 绑定拖拽事件
         self.map_canvas.bind("<Button-1>", self.on_map_click)
         self.map_canvas.bind("<B1-Motion>", self.on_map_drag)
@@ -180,6 +250,14 @@ class ThemeParkGUI:
         # 设施利用率仪表盘
         self.create_utilization_gauge()
         
+        # 只更新当前可见的图表标签页，顺序与标签页一致
+        self._active_tab = 0
+        self._chart_updaters = [self.update_queue_chart, self.update_heatmap_chart, self.update_utilization_gauge]
+        self.chart_notebook.bind("<<NotebookTabChanged>>", self.on_chart_tab_change)
+        # 排队图表标签页显示时各设施才记录排队历史
+        self._history_subscribed = False
+        self.sync_history_subscriptions()
+        
         # 隐藏加载屏幕
         self.root.after(1500, self._hide_loading_screen)
     
@@ -249,8 +327,11 @@ class ThemeParkGUI:
         
         # 游客数量输入
         ttk.Label(self.visitor_frame, text="游客数量:").pack(anchor="w", pady=2)
-        self.visitor_count_var = tk.StringVar(value="10")
-        ttk.Entry(self.visitor_frame, textvariable=self.visitor_count_var, width=10).pack(fill=tk.X)
+        self.visitor_count_var = tk.IntVar(value=10)
+        ttk.Entry(
+            self.visitor_frame, textvariable=self.visitor_count_var, width=10,
+            validate="key", validatecommand=(self.root.register(self.validate_int), "%P")
+        ).pack(fill=tk.X)
         
         # 生成游客按钮
         ttk.Button(
@@ -311,6 +392,18 @@ class ThemeParkGUI:
         )
         self.chart_facility_combo.pack(fill=tk.X)
         self.chart_facility_combo.bind("<<ComboboxSelected>>", self.on_chart_facility_change)
+        
+        # 图表刷新间隔
+        ttk.Label(operation_frame, text="图表刷新间隔(模拟步):").pack(anchor="w", pady=2)
+        self.disp_skip_var = tk.IntVar(value=self.disp_skip)
+        tk.Scale(
+            operation_frame,
+            from_=1,
+            to=50,
+            orient=tk.HORIZONTAL,
+            variable=self.disp_skip_var,
+            command=self.on_disp_skip_change
+        ).pack(fill=tk.X)
     
     def create_queue_chart(self):
         """
@@ -325,12 +418,54 @@ class ThemeParkGUI:
         self.queue_ax.set_xlabel("时间")
         self.queue_ax.set_ylabel("排队人数")
         self.queue_ax.grid(True)
+        self.queue_ax.set_xlim(0, 60)
+        self.queue_ax.set_ylim(0, 10)
+        
+        # x轴显示为"分:秒"格式，坐标轴格式只设置一次
+        self.queue_ax.xaxis.set_major_formatter(
+            FuncFormatter(lambda x, _: f"{int(x) // 60}:{int(x) % 60:02d}")
+        )
+        self.queue_ax.tick_params(axis="x", labelsize=8)
+        self.queue_fig.tight_layout()
+        
+        # 每个设施一条常驻折线，更新时只修改数据并局部重绘
+        self._queue_lines: Dict[str, Line2D] = {}
         
         # 创建画布
         self.queue_canvas = FigureCanvasTkAgg(self.queue_fig, master=queue_frame)
+        self.queue_canvas.mpl_connect("draw_event", self.on_queue_draw)
         self.queue_canvas.draw()
+        self._queue_bg = self.queue_canvas.copy_from_bbox(self.queue_ax.bbox)
         self.queue_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
     
+    def on_queue_draw(self, event):
+        """
+        完整重绘（缩放、窗口尺寸变化等）后重新缓存折线图背景
+        """
+        self._queue_bg = self.queue_canvas.copy_from_bbox(self.queue_ax.bbox)
+        self.blit_queue_lines()
+    
+    def blit_queue_lines(self):
+        """
+        恢复缓存背景后只重绘折线并局部刷新
+        """
+        self.queue_canvas.restore_region(self._queue_bg)
+        for line in self._queue_lines.values():
+            self.queue_ax.draw_artist(line)
+        self.queue_canvas.blit(self.queue_ax.bbox)
+    
+    def refresh_queue_legend(self):
+        """
+        折线增删或显示设施变化后更新图例并完整重绘一次
+        """
+        handles = [line for line in self._queue_lines.values() if line.get_visible()]
+        legend = self.queue_ax.get_legend()
+        if handles:
+            self.queue_ax.legend(handles=handles)
+        elif legend is not None:
+            legend.remove()
+        self.queue_canvas.draw_idle()
+    
     def create_heatmap_chart(self):
         """
         创建等待时间热力图
@@ -338,15 +473,51 @@ class ThemeParkGUI:
         heatmap_frame = ttk.Frame(self.chart_notebook)
         self.chart_notebook.add(heatmap_frame, text="等待时间热力图")
         
-        # 创建图表
-        self.heatmap_fig, self.heatmap_ax = plt.subplots(figsize=(5, 4), dpi=100)
+        # 创建图表，布局由constrained_layout在完整重绘时处理，更新数据时不再重新计算布局
+        self.heatmap_fig, self.heatmap_ax = plt.subplots(figsize=(5, 4), dpi=100, layout="constrained")
         self.heatmap_ax.set_title("游客平均等待时间热力图")
         
+        # 热力图网格（QuadMesh）和颜色条只创建一次，之后只更新数据
+        self.heatmap_time_slots = ["0-10分钟", "10-20分钟", "20-30分钟", "30-40分钟", "40-50分钟", "50-60分钟"]
+        self.heatmap_label_limit = 120  # 单元格超过该数量时不标注数值
+        self.heatmap_label_min = 0.05  # 小于该值（分钟）的单元格不标注数值
+        self._heatmap_buf = np.zeros((len(self.heatmap_time_slots), 1))
+        self._heatmap_edges = np.arange(len(self.heatmap_time_slots) + 1) * 600.0  # 时段边界（秒）
+        self._heatmap_mesh = self.heatmap_ax.pcolormesh(self._heatmap_buf, cmap="Reds", animated=True)
+        self._heatmap_cbar = self.heatmap_fig.colorbar(self._heatmap_mesh, ax=self.heatmap_ax)
+        self._heatmap_cbar.set_label("平均等待时间(分钟)")
+        self.heatmap_ax.invert_yaxis()  # 第一个时段显示在最上方
+        self.heatmap_ax.set_yticks(np.arange(len(self.heatmap_time_slots)) + 0.5)
+        self.heatmap_ax.set_yticklabels(self.heatmap_time_slots, fontsize=8)
+        self._heatmap_names: Tuple[str, ...] = ()  # 当前热力图对应的设施
+        self._heatmap_texts: List[List[Any]] = []  # 单元格数值标注
+        self._last_heatmap = float("-inf")
+        
         # 创建画布
         self.heatmap_canvas = FigureCanvasTkAgg(self.heatmap_fig, master=heatmap_frame)
+        self.heatmap_canvas.mpl_connect("draw_event", self.on_heatmap_draw)
         self.heatmap_canvas.draw()
+        self._heatmap_bg = self.heatmap_canvas.copy_from_bbox(self.heatmap_ax.bbox)
         self.heatmap_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
     
+    def on_heatmap_draw(self, event):
+        """
+        完整重绘后重新缓存热力图背景
+        """
+        self._heatmap_bg = self.heatmap_canvas.copy_from_bbox(self.heatmap_ax.bbox)
+        self.blit_heatmap()
+    
+    def blit_heatmap(self):
+        """
+        恢复缓存背景后只重绘热力图网格和数值标注并局部刷新
+        """
+        self.heatmap_canvas.restore_region(self._heatmap_bg)
+        self.heatmap_ax.draw_artist(self._heatmap_mesh)
+        for row in self._heatmap_texts:
+            for text in row:
+                self.heatmap_ax.draw_artist(text)
+        self.heatmap_canvas.blit(self.heatmap_ax.bbox)
+    
     def create_utilization_gauge(self):
         """
         创建设施利用率仪表盘
@@ -357,22 +528,31 @@ class ThemeParkGUI:
         # 创建仪表盘框架
         self.gauge_content_frame = ttk.Frame(gauge_frame)
         self.gauge_content_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # 设施名称 -> (卡片, 利用率标签)，卡片常驻，设施增删时从卡片池取出或放回
+        self._gauge_cards: Dict[str, Tuple[ttk.LabelFrame, ttk.Label]] = {}
+        self._gauge_pool: List[Tuple[ttk.LabelFrame, ttk.Label]] = []  # 暂未使用的卡片
+        self._gauge_texts: Dict[str, str] = {}  # 各标签当前显示的文本
+        self._gauge_rows = 0  # 卡片占用的网格行数
+        self._gauge_empty_label = ttk.Label(self.gauge_content_frame, text="暂无设施数据")
+        self._gauge_empty_label.pack(pady=20)
     
     def load_facilities(self):
         """
         加载设施布局
         """
         layout_data = load_layout()
+        now = time.monotonic()  # 所有设施共用同一个创建时间
         
         if not layout_data:
             # 如果没有布局数据，创建默认设施
-            default_facilities = create_default_facilities()
+            default_facilities = create_default_facilities(now)
             for facility in default_facilities:
                 self.add_facility(facility)
         else:
             # 从布局数据加载设施
             for name, data in layout_data.items():
-                facility = Facility.from_dict(data)
+                facility = Facility.from_dict(data, now)
                 self.add_facility(facility)
     
     def add_facility_dialog(self):
@@ -396,13 +576,18 @@ class ThemeParkGUI:
         
         # 设施容量
         ttk.Label(dialog, text="设施容量:").grid(row=1, column=0, sticky="w", padx=10, pady=5)
-        capacity_var = tk.StringVar(value=str(type_info.get("default_capacity", 20)))
-        ttk.Entry(dialog, textvariable=capacity_var, width=20).grid(row=1, column=1, padx=10, pady=5)
+        validate_int = (dialog.register(self.validate_int), "%P")
+        capacity_var = tk.IntVar(value=type_info.get("default_capacity", 20))
+        ttk.Entry(
+            dialog, textvariable=capacity_var, width=20, validate="key", validatecommand=validate_int
+        ).grid(row=1, column=1, padx=10, pady=5)
         
         # 运行时长
         ttk.Label(dialog, text="运行时长(秒):").grid(row=2, column=0, sticky="w", padx=10, pady=5)
-        run_time_var = tk.StringVar(value=str(type_info.get("default_run_time", 120)))
-        ttk.Entry(dialog, textvariable=run_time_var, width=20).grid(row=2, column=1, padx=10, pady=5)
+        run_time_var = tk.IntVar(value=type_info.get("default_run_time", 120))
+        ttk.Entry(
+            dialog, textvariable=run_time_var, width=20, validate="key", validatecommand=validate_int
+        ).grid(row=2, column=1, padx=10, pady=5)
         
         def confirm():
             try:
@@ -415,19 +600,22 @@ class ThemeParkGUI:
                     messagebox.showerror("错误", "设施名称已存在")
                     return
                 
-                capacity = int(capacity_var.get())
+                capacity = capacity_var.get()
                 if capacity < 1:
                     messagebox.showerror("错误", "设施容量必须大于0")
                     return
                 
-                run_time = int(run_time_var.get())
+                run_time = run_time_var.get()
                 if run_time < 10:
                     messagebox.showerror("错误", "运行时长必须大于等于10秒")
                     return
                 
-                # 生成随机位置
-                existing_positions = [(f.x, f.y) for f in self.facilities.values()]
-                x, y = generate_random_position(self.map_size, existing_positions)
+                if not self._free_cells:
+                    messagebox.showerror("错误", "地图已满，无法添加设施")
+                    return
+                
+                # 从空闲格子中随机选择位置
+                x, y = generate_random_position(self.map_size, free_cells=self._free_cells)
                 
                 # 创建设施
                 facility = FacilityFactory.create_facility(
@@ -435,13 +623,7 @@ class ThemeParkGUI:
                 )
                 
                 # 添加撤销操作
-                def undo_add():
-                    self.remove_facility(name)
-                
-                def redo_add():
-                    self.add_facility(facility)
-                
-                self.command_stack.push(undo_add, redo_add)
+                self.command_stack.push(Command("remove", name), Command("add", facility.to_dict()))
                 self.update_undo_redo_buttons()
                 
                 # 实际添加设施
@@ -449,7 +631,8 @@ class ThemeParkGUI:
                 
                 dialog.destroy()
                 
-            except ValueError:
+            except tk.TclError:
+                # 输入框为空时IntVar无法取值
                 messagebox.showerror("错误", "请输入有效的数字")
         
         # 按钮
@@ -459,19 +642,41 @@ class ThemeParkGUI:
         ttk.Button(btn_frame, text="确定", command=confirm).pack(side=tk.LEFT, padx=10)
         ttk.Button(btn_frame, text="取消", command=dialog.destroy).pack(side=tk.LEFT, padx=10)
     
-    def add_facility(self, facility: Facility):
+    def add_facility(self, facility: Facility) -> bool:
         """
         添加设施到地图
         参数:
             facility: 设施对象
-        """
+        返回:
+            是否添加成功；原位置已被占用且地图没有空闲格子时不添加
+        """
+        if not self.occupy_cell(facility.name, facility.x, facility.y):
+            # 原位置已被其他设施占用（如撤销删除时该格子已被占），换到空闲格子
+            if not self.relocate_facility(facility):
+                messagebox.showerror("错误", f"地图已满，无法放置设施：{facility.name}")
+                return False
         self.facilities[facility.name] = facility
-        self.queue_history[facility.name] = []
-        self.utilization_history[facility.name] = []
-        self.waiting_time_history[facility.name] = []
+        self.facility_index.register(facility.name)
+        self._vtargets_dirty = True
+        if self._history_subscribed:
+            facility.subscribe_history()
+        self.history[facility.name] = RingBuffer(self.history_capacity)
+        self.history_lowres[facility.name] = RingBuffer(self.history_capacity)
         self.update_chart_facility_combo()
-        self.draw_map()
-        save_layout(list(self.facilities.values()))
+        
+        # 为新设施创建常驻折线，配色按设施数量缓存在get_available_colors中
+        line, = self.queue_ax.plot([], [], animated=True, label=facility.name,
+                                   color=get_available_colors(len(self.facilities))[-1])
+        line.set_visible(self.current_chart_facility in ("所有设施", facility.name))
+        old_line = self._queue_lines.pop(facility.name, None)
+        if old_line is not None:
+            old_line.remove()
+        self._queue_lines[facility.name] = line
+        self.refresh_queue_legend()
+        
+        self._map_dirty = True
+        self.schedule_save_layout()
+        return True
     
     def remove_facility(self, facility_name: str):
         """
@@ -480,10 +685,119 @@ class ThemeParkGUI:
             facility_name: 设施名称
         """
         if facility_name in self.facilities:
-            del self.facilities[facility_name]
+            facility = self.facilities.pop(facility_name)
+            self.release_cell(facility_name, facility.x, facility.y)
+            if self._history_subscribed:
+                facility.unsubscribe_history()
+            # 释放设施的位索引，并清除游客位掩码中的对应位，避免复用该位的新设施被误判为已访问
+            bit = self.facility_index.release(facility_name)
+            if bit is not None:
+                keep = ~(1 << bit)
+                for visitor in self.visitors:
+                    visitor.visited_mask &= keep
+            self._vtargets_dirty = True
+            line = self._queue_lines.pop(facility_name, None)
+            if line is not None:
+                line.remove()
+                self.refresh_queue_legend()
             self.update_chart_facility_combo()
-            self.draw_map()
-            save_layout(list(self.facilities.values()))
+            self._map_dirty = True
+            self.schedule_save_layout()
+    
+    def move_facility(self, facility: Facility, x: int, y: int) -> bool:
+        """
+        移动设施并同步网格索引
+        参数:
+            facility: 设施对象
+            x: 新的x坐标
+            y: 新的y坐标
+        返回:
+            是否移动成功；目标格子已被占用且没有空闲格子时留在原位置
+        """
+        old_x, old_y = facility.x, facility.y
+        self.release_cell(facility.name, old_x, old_y)
+        facility.move(x, y)
+        if not self.occupy_cell(facility.name, x, y):
+            # 目标格子已被其他设施占用（如撤销移动时原位置已被占），换到空闲格子
+            if not self.relocate_facility(facility):
+                facility.move(old_x, old_y)
+                self.occupy_cell(facility.name, old_x, old_y)
+                messagebox.showerror("错误", f"地图已满，无法移动设施：{facility.name}")
+                return False
+        self._vtargets_dirty = True
+        self._map_dirty = True
+        return True
+    
+    def occupy_cell(self, facility_name: str, x: int, y: int) -> bool:
+        """
+        记录设施占用的格子，格子已被其他设施占用时不覆盖
+        参数:
+            facility_name: 设施名称
+            x: x坐标
+            y: y坐标
+        返回:
+            是否占用成功
+        """
+        if self._grid_index.setdefault((x, y), facility_name) != facility_name:
+            return False
+        self._free_cells.discard((x, y))
+        return True
+    
+    def relocate_facility(self, facility: Facility) -> bool:
+        """
+        把设施放到一个随机的空闲格子上
+        参数:
+            facility: 设施对象（尚未占用任何格子）
+        返回:
+            是否放置成功；地图没有空闲格子时设施位置不变
+        """
+        if not self._free_cells:
+            return False
+        x, y = generate_random_position(self.map_size, free_cells=self._free_cells)
+        facility.move(x, y)
+        return self.occupy_cell(facility.name, x, y)
+    
+    def release_cell(self, facility_name: str, x: int, y: int):
+        """
+        设施离开格子后释放占用
+        参数:
+            facility_name: 设施名称
+            x: x坐标
+            y: y坐标
+        """
+        if self._grid_index.get((x, y)) == facility_name:
+            del self._grid_index[(x, y)]
+            if 0 <= x < self.map_size and 0 <= y < self.map_size:
+                self._free_cells.add((x, y))
+    
+    def _apply_move_command(self, payload: Tuple[str, int, int]):
+        """
+        执行撤销/重做中的移动命令
+        参数:
+            payload: (设施名称, x坐标, y坐标)
+        """
+        name, x, y = payload
+        facility = self.facilities.get(name)
+        if facility is not None:
+            self.move_facility(facility, x, y)
+            self.schedule_save_layout()
+    
+    def schedule_save_layout(self):
+        """
+        延迟保存布局，短时间内的多次修改合并为一次写盘
+        """
+        if self._save_job is not None:
+            self.root.after_cancel(self._save_job)
+        self._save_job = self.root.after(self.save_delay, self.flush_save_layout)
+    
+    def flush_save_layout(self):
+        """
+        立即保存布局并取消尚未执行的延迟保存
+        """
+        if self._save_job is not None:
+            self.root.after_cancel(self._save_job)
+            self._save_job = None
+        save_layout(list(self.facilities.values()))
     
     def delete_selected_facility(self):
         """
@@ -516,13 +830,7 @@ class ThemeParkGUI:
         facility_info = facility.to_dict()
         
         # 添加撤销操作
-        def undo_delete():
-            self.add_facility(Facility.from_dict(facility_info))
-        
-        def redo_delete():
-            self.remove_facility(facility_name)
-        
-        self.command_stack.push(undo_delete, redo_delete)
+        self.command_stack.push(Command("add", facility_info), Command("remove", facility_name))
         self.update_undo_redo_buttons()
         
         # 实际删除设施
@@ -533,7 +841,7 @@ class ThemeParkGUI:
         生成游客
         """
         try:
-            count = int(self.visitor_count_var.get())
+            count = self.visitor_count_var.get()
             if count <= 0:
                 messagebox.showerror("错误", "游客数量必须大于0")
                 return
@@ -552,12 +860,58 @@ class ThemeParkGUI:
                 count, entry_x, entry_y, facility_names
             )
             
-            self.visitors.extend(new_visitors)
-            self.draw_map()
+            self.add_visitors(new_visitors)
             
-        except ValueError:
+        except tk.TclError:
+            # 输入框为空时IntVar无法取值
             messagebox.showerror("错误", "请输入有效的数字")
     
+    @staticmethod
+    def validate_int(value: str) -> bool:
+        """
+        数字输入框的按键校验，只允许输入数字（允许清空后重新输入）
+        IntVar由Tcl解析，前导0会被当作八进制（"010"得到8，"08"报错），因此不允许前导0
+        参数:
+            value: 修改后的输入框内容
+        返回:
+            是否接受本次修改
+        """
+        if value == "":
+            return True
+        return value.isascii() and value.isdigit() and (value == "0" or value[0] != "0")
+    
+    def add_visitors(self, new_visitors: List[Visitor]):
+        """
+        添加游客并扩充游客目标数组
+        参数:
+            new_visitors: 游客列表
+        """
+        end = len(self.visitors) + len(new_visitors)
+        if end > len(self._vst):
+            # 容量不足时翻倍扩容
+            capacity = len(self._vst)
+            while capacity < end:
+                capacity *= 2
+            self._vtgt = np.resize(self._vtgt, (capacity, 2))
+            self._vst = np.resize(self._vst, capacity)
+        
+        self.visitors.extend(new_visitors)
+        self._vtargets_dirty = True
+        self._map_dirty = True
+    
+    def refresh_visitor_targets(self):
+        """
+        根据游客状态和目标设施位置重新整理目标数组和移动状态
+        """
+        for i, visitor in enumerate(self.visitors):
+            facility = self.facilities.get(visitor.target_facility)
+            if visitor.status_code == Status.FREE and facility is not None:
+                self._vtgt[i] = (facility.x, facility.y)
+                self._vst[i] = VISITOR_MOVING
+            else:
+                self._vst[i] = VISITOR_IDLE
+        self._vtargets_dirty = False
+    
     def toggle_simulation(self):
         """
         切换模拟状态
@@ -573,161 +927,299 @@ class ThemeParkGUI:
         """
         更新模拟状态
         """
-        current_time = time.time()
+        current_time = time.monotonic()
         
         if self.simulation_running:
-            # 更新设施状态
-            for facility in self.facilities.values():
-                facility.update_status(current_time)
+            # 设施状态更新、发车、排队变化检查和历史记录合并在一次遍历中完成
+            history = self.history
+            history_lowres = self.history_lowres
+            queue_snapshot = self._queue_snapshot
+            update_status = Facility.update_status
+            self._tick += 1
+            record_lowres = self._tick % self.lowres_every == 0
+            map_dirty = False
+            for name, facility in self.facilities.items():
+                update_status(facility, current_time)
+                queue_length = facility.get_queue_length()
                 
                 # 如果设施空闲且有游客在排队，开始运行
-                if not facility.is_running and facility.get_queue_length() > 0:
+                if queue_length and not facility.is_running:
                     facility.start_run(current_time)
+                    queue_length = facility.get_queue_length()
+                    map_dirty = True
+                
+                # 排队人数变化时需要重绘
+                if queue_snapshot.get(name) != queue_length:
+                    queue_snapshot[name] = queue_length
+                    map_dirty = True
                 
                 # 更新历史数据
-                self.queue_history[facility.name].append(
-                    (current_time, facility.get_queue_length())
-                )
-                self.utilization_history[facility.name].append(
-                    (current_time, facility.get_utilization())
-                )
+                utilization = facility.get_utilization()
+                waiting_time = facility.get_avg_waiting_time()
+                history[name].push(current_time, queue_length, utilization, waiting_time)
+                if record_lowres:
+                    history_lowres[name].push(current_time, queue_length, utilization, waiting_time)
+            if map_dirty:
+                self._map_dirty = True
             
-            # 更新游客状态
-            for visitor in self.visitors:
-                if visitor.status == "自由" and visitor.target_facility:
-                    # 向目标设施移动
-                    target_facility = self.facilities.get(visitor.target_facility)
-                    if target_facility:
-                        if visitor.move_towards(target_facility.x, target_facility.y):
-                            # 到达设施，开始等待
-                            visitor.start_waiting()
-                            target_facility.add_visitor(visitor)
-                elif visitor.status == "游玩":
-                    # 检查是否游玩结束
-                    # 这里简化处理，实际应该与设施运行同步
-                    pass
+            # 更新游客状态：所有移动中的游客一次性前进一步
+            arrivals: Dict[str, List[Visitor]] = {}  # 本次到达各设施的游客
+            count = len(self.visitors)
+            if count:
+                if self._vtargets_dirty:
+                    self.refresh_visitor_targets()
+                # 移动和到达后转为等待都在结构数组上批量完成，游客对象直接读取数组，无需逐个同步
+                arrived_mask = np.zeros(count, dtype=bool)
+                moved = tick_visitors(self.visitor_generator.arrays, self._vtgt, self._vst,
+                                      current_time, arrived_mask)
+                
+                # 只需逐个处理本步到达的游客，按目标设施分组
+                visitors = self.visitors
+                for i in np.flatnonzero(arrived_mask).tolist():
+                    visitor = visitors[i]
+                    arrivals.setdefault(visitor.target_facility, []).append(visitor)
+                
+                if arrivals or moved.any():
+                    self._map_dirty = True
             
-            # 更新图表（每秒更新一次）
-            if current_time - self.last_chart_update >= 1.0:
+            # 到达的游客按设施批量加入排队队列
+            for facility_name, arrived in arrivals.items():
+                self.facilities[facility_name].add_visitors(arrived)
+            
+            # 图表开销较大，每disp_skip个模拟步才刷新一次，模拟本身每步都执行
+            if self._tick % self.disp_skip == 0:
                 self.update_charts()
-                self.last_chart_update = current_time
         
-        # 重绘地图（无论是否运行都需要绘制）
-        self.draw_map()
+        # 状态有变化或超过最长间隔时才重绘地图
+        if self._map_dirty or current_time - self._last_render > self.render_interval:
+            self.draw_map()
+            self._map_dirty = False
+            self._last_render = current_time
         
         # 继续更新
         self.root.after(100, self.update_simulation)
     
-    def draw_map(self):
+    def draw_grid(self):
         """
-        绘制地图
+        绘制地图网格线
         """
-        self.map_canvas.delete("all")
-        
-        # 绘制网格
+        size = self.map_size * self.cell_size
         for i in range(self.map_size + 1):
             x = i * self.cell_size
             y = i * self.cell_size
-            self.map_canvas.create_line(x, 0, x, self.map_size * self.cell_size)
-            self.map_canvas.create_line(0, y, self.map_size * self.cell_size, y)
+            self.map_canvas.create_line(x, 0, x, size, tags="grid")
+            self.map_canvas.create_line(0, y, size, y, tags="grid")
+    
+    def draw_map(self):
+        """
+        绘制地图
+        画布元素只在首次出现时创建，之后仅对状态发生变化的元素调用coords/itemconfigure
+        """
+        canvas = self.map_canvas
+        cs = self.cell_size
+        
+        # 移除已删除设施的元素
+        if self._facility_items.keys() != self.facilities.keys():
+            for name in [n for n in self._facility_items if n not in self.facilities]:
+                items = self._facility_items.pop(name)
+                for key in ("bg", "emoji", "name", "queue"):
+                    canvas.delete(items[key])
         
         # 绘制设施
-        for facility in self.facilities.values():
-            x1 = facility.x * self.cell_size
-            y1 = facility.y * self.cell_size
-            x2 = x1 + self.cell_size
-            y2 = y1 + self.cell_size
-            
-            # 设施背景
-            fill_color = "lightblue" if facility.is_running else "lightgray"
-            self.map_canvas.create_rectangle(
-                x1, y1, x2, y2, fill=fill_color, outline="black"
-            )
-            
-            # 设施图标
-            self.map_canvas.create_text(
-                (x1 + x2) / 2, (y1 + y2) / 2 - 10,
-                text=facility.emoji,
-                font=("SimHei", 16)
-            )
-            
-            # 设施名称
-            self.map_canvas.create_text(
-                (x1 + x2) / 2, (y1 + y2) / 2 + 10,
-                text=facility.name,
-                font=("SimHei", 8)
-            )
-            
-            # 排队人数
+        emoji_font = self._emoji_font
+        name_font = self._name_font
+        queue_font = self._queue_count_font
+        facility_created = False
+        for name, facility in self.facilities.items():
             queue_length = facility.get_queue_length()
-            color = get_queue_color(queue_length)
-            self.map_canvas.create_text(
-                x1 + 10, y1 + 10,
-                text=f"{queue_length}",
-                fill=color,
-                font=("SimHei", 10, "bold")
-            )
+            state = (facility.x, facility.y, facility.is_running, queue_length)
+            items = self._facility_items.get(name)
+            if items is not None and items["state"] == state:
+                continue
             
-            # 保存设施位置信息，用于拖拽
-            self.map_canvas.create_rectangle(
-                x1, y1, x2, y2,
-                fill="", outline="", tags=("facility", facility.name)
-            )
-        
-        # 绘制游客
-        for visitor in self.visitors:
-            x = visitor.x * self.cell_size + self.cell_size / 2
-            y = visitor.y * self.cell_size + self.cell_size / 2
+            is_running = state[2]
+            fill_color = "lightblue" if is_running else "lightgray"
             
-            # 游客图标
-            self.map_canvas.create_text(
-                x, y,
-                text=visitor.emoji,
-                font=("SimHei", 14)
-            )
+            if items is None:
+                x1 = facility.x * cs
+                y1 = facility.y * cs
+                x2 = x1 + cs
+                y2 = y1 + cs
+                queue_color = get_queue_color(queue_length)
+                # 所有元素都带上("facility", 名称)标签，用于点击拖拽
+                tags = ("facility", name)
+                items = {
+                    # 设施背景
+                    "bg": canvas.create_rectangle(
+                        x1, y1, x2, y2, fill=fill_color, outline="black", tags=tags
+                    ),
+                    # 设施图标
+                    "emoji": canvas.create_text(
+                        (x1 + x2) / 2, (y1 + y2) / 2 - 10,
+                        text=facility.emoji, font=emoji_font, tags=tags
+                    ),
+                    # 设施名称
+                    "name": canvas.create_text(
+                        (x1 + x2) / 2, (y1 + y2) / 2 + 10,
+                        text=facility.name, font=name_font, tags=tags
+                    ),
+                    # 排队人数
+                    "queue": canvas.create_text(
+                        x1 + 10, y1 + 10,
+                        text=f"{queue_length}", fill=queue_color,
+                        font=queue_font, tags=tags
+                    ),
+                    "queue_color": queue_color,
+                }
+                self._facility_items[name] = items
+                facility_created = True
+            else:
+                old_x, old_y, old_running, old_queue = items["state"]
+                if old_x != state[0] or old_y != state[1]:
+                    self.place_facility_items(items, state[0], state[1])
+                if old_running != is_running:
+                    canvas.itemconfigure(items["bg"], fill=fill_color)
+                if old_queue != queue_length:
+                    # 颜色只在跨过阈值时才需要修改
+                    queue_color = get_queue_color(queue_length)
+                    if queue_color != items["queue_color"]:
+                        items["queue_color"] = queue_color
+                        canvas.itemconfigure(items["queue"], text=f"{queue_length}", fill=queue_color)
+                    else:
+                        canvas.itemconfigure(items["queue"], text=f"{queue_length}")
+            items["state"] = state
+        
+        # 新设施的元素创建在最上层，需要把游客重新放到设施之上
+        if facility_created:
+            canvas.tag_raise("visitor")
+        
+        # 移除已不存在的游客的元素
+        if len(self._visitor_items) != len(self.visitors):
+            alive = {id(visitor) for visitor in self.visitors}
+            for key in [k for k in self._visitor_items if k not in alive]:
+                items = self._visitor_items.pop(key)
+                for item_key in ("icon", "bubble_bg", "bubble_text"):
+                    canvas.delete(items[item_key])
+        
+        # 绘制游客：坐标和状态每帧从结构数组一次性转换为Python列表，不再逐个游客读取数组元素
+        bubble_height = 20
+        arrays = self.visitor_generator.arrays
+        count = len(self.visitors)
+        coords = arrays.xy[:count].tolist()
+        statuses = arrays.status[:count].tolist()
+        for visitor, (vx, vy), status in zip(self.visitors, coords, statuses):
+            bubble_text = visitor.get_bubble_text(status)
+            state = (vx, vy, bubble_text)
+            items = self._visitor_items.get(id(visitor))
+            if items is not None and items["state"] == state:
+                continue
             
-            # 气泡文本
-            bubble_text = visitor.get_bubble_text()
-            bubble_width = len(bubble_text) * 8
-            bubble_height = 20
+            x = vx * cs + cs / 2
+            y = vy * cs + cs / 2
             
-            # 绘制气泡背景
-            self.map_canvas.create_rectangle(
+            # 气泡宽度按实际字体测量，相同文本只测量一次
+            bubble_width = self._bubble_widths.get(bubble_text)
+            if bubble_width is None:
+                bubble_width = self._bubble_font.measure(bubble_text)
+                self._bubble_widths[bubble_text] = bubble_width
+            bubble_box = (
                 x - bubble_width / 2 - 5,
                 y - bubble_height - 15,
                 x + bubble_width / 2 + 5,
-                y - 15,
-                fill="white",
-                outline="black",
-                width=1
+                y - 15
             )
             
-            # 绘制气泡文本
-            self.map_canvas.create_text(
-                x,
-                y - bubble_height / 2 - 15,
-                text=bubble_text,
-                font=("SimHei", 8)
+            if items is None:
+                # 游客图标优先使用缓存的emoji位图
+                emoji_image = self.get_emoji_image(visitor.emoji)
+                if emoji_image is not None:
+                    icon = canvas.create_image(x, y, image=emoji_image, tags="visitor")
+                else:
+                    icon = canvas.create_text(x, y, text=visitor.emoji, font=self._visitor_font, tags="visitor")
+                items = {
+                    # 游客图标
+                    "icon": icon,
+                    # 气泡背景
+                    "bubble_bg": canvas.create_rectangle(
+                        *bubble_box, fill="white", outline="black", width=1, tags="visitor"
+                    ),
+                    # 气泡文本
+                    "bubble_text": canvas.create_text(
+                        x, y - bubble_height / 2 - 15,
+                        text=bubble_text, font=self._bubble_font, tags="visitor"
+                    ),
+                }
+                self._visitor_items[id(visitor)] = items
+            else:
+                old_x, old_y, old_text = items["state"]
+                if (old_x, old_y) != (vx, vy):
+                    canvas.coords(items["icon"], x, y)
+                    canvas.coords(items["bubble_text"], x, y - bubble_height / 2 - 15)
+                canvas.coords(items["bubble_bg"], *bubble_box)
+                if old_text != bubble_text:
+                    canvas.itemconfigure(items["bubble_text"], text=bubble_text)
+            items["state"] = state
+    
+    def get_emoji_image(self, emoji: str, size: int = 20) -> Optional[ImageTk.PhotoImage]:
+        """
+        获取emoji对应的位图，首次使用时渲染并缓存
+        参数:
+            emoji: emoji字符
+            size: 位图边长（像素）
+        返回:
+            位图对象；系统没有可用的emoji字体时返回None，由调用方改用文本绘制
+        """
+        if emoji in self._emoji_images:
+            return self._emoji_images[emoji]
+        
+        image = None
+        if self._emoji_pil_font is not None:
+            font = self._emoji_pil_font
+            left, top, right, bottom = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox(
+                (0, 0), emoji, font=font, embedded_color=True
             )
+            sprite = Image.new("RGBA", (max(1, right - left), max(1, bottom - top)), (0, 0, 0, 0))
+            ImageDraw.Draw(sprite).text((-left, -top), emoji, font=font, embedded_color=True)
+            sprite.thumbnail((size, size), Image.LANCZOS)
+            image = ImageTk.PhotoImage(sprite, master=self.root)
+        
+        self._emoji_images[emoji] = image
+        return image
+    
+    def place_facility_items(self, items: Dict[str, Any], x: int, y: int):
+        """
+        把设施的画布元素移动到指定格子，只修改坐标不重建元素
+        参数:
+            items: 设施的画布元素记录
+            x: 网格x坐标
+            y: 网格y坐标
+        """
+        canvas = self.map_canvas
+        cs = self.cell_size
+        x1 = x * cs
+        y1 = y * cs
+        x2 = x1 + cs
+        y2 = y1 + cs
+        canvas.coords(items["bg"], x1, y1, x2, y2)
+        canvas.coords(items["emoji"], (x1 + x2) / 2, (y1 + y2) / 2 - 10)
+        canvas.coords(items["name"], (x1 + x2) / 2, (y1 + y2) / 2 + 10)
+        canvas.coords(items["queue"], x1 + 10, y1 + 10)
     
     def on_map_click(self, event):
         """
         处理地图点击事件
         """
-        # 获取点击位置的设施
-        items = self.map_canvas.find_closest(event.x, event.y)
-        if items:
-            tags = self.map_canvas.gettags(items[0])
-            if "facility" in tags and len(tags) > 1:
-                facility_name = tags[1]
-                if facility_name in self.facilities:
-                    self.dragging_facility = facility_name
-                    self.drag_start_x = event.x
-                    self.drag_start_y = event.y
-                    self.drag_data = {
-                        "x": self.facilities[facility_name].x,
-                        "y": self.facilities[facility_name].y
-                    }
+        # 根据网格坐标直接查找点击位置的设施
+        grid_pos = (event.x // self.cell_size, event.y // self.cell_size)
+        facility_name = self._grid_index.get(grid_pos)
+        if facility_name is not None:
+            self.dragging_facility = facility_name
+            self.drag_start_x = event.x
+            self.drag_start_y = event.y
+            self.drag_data = {
+                "x": self.facilities[facility_name].x,
+                "y": self.facilities[facility_name].y
+            }
     
     def on_map_drag(self, event):
         """
@@ -739,18 +1231,14 @@ class ThemeParkGUI:
             grid_y = min(max(0, event.y // self.cell_size), self.map_size - 1)
             
             # 检查是否与其他设施位置冲突
-            collision = False
-            for name, facility in self.facilities.items():
-                if name != self.dragging_facility and facility.x == grid_x and facility.y == grid_y:
-                    collision = True
-                    break
-            
-            if not collision:
-                # 临时移动设施显示
-                facility = self.facilities[self.dragging_facility]
-                facility.x = grid_x
-                facility.y = grid_y
-                self.draw_map()
+            other = self._grid_index.get((grid_x, grid_y))
+            if other is None:
+                # 临时移动设施，只移动该设施的画布元素，不重绘整个地图
+                self.move_facility(self.facilities[self.dragging_facility], grid_x, grid_y)
+                items = self._facility_items.get(self.dragging_facility)
+                if items is not None:
+                    self.place_facility_items(items, grid_x, grid_y)
+                    items["state"] = (grid_x, grid_y) + items["state"][2:]
     
     def on_map_release(self, event):
         """
@@ -766,19 +1254,14 @@ class ThemeParkGUI:
             # 如果位置有变化，记录操作
             if old_x != new_x or old_y != new_y:
                 # 添加撤销操作
-                def undo_move():
-                    facility.move(old_x, old_y)
-                    save_layout(list(self.facilities.values()))
-                
-                def redo_move():
-                    facility.move(new_x, new_y)
-                    save_layout(list(self.facilities.values()))
-                
-                self.command_stack.push(undo_move, redo_move)
+                self.command_stack.push(
+                    Command("move", (facility.name, old_x, old_y)),
+                    Command("move", (facility.name, new_x, new_y))
+                )
                 self.update_undo_redo_buttons()
                 
                 # 保存新位置
-                save_layout(list(self.facilities.values()))
+                self.schedule_save_layout()
             
             self.dragging_facility = None
             self.drag_data = {}
@@ -816,150 +1299,220 @@ class ThemeParkGUI:
         处理图表设施选择变化
         """
         self.current_chart_facility = self.chart_facility_var.get()
+        show_all = self.current_chart_facility == "所有设施"
+        for name, line in self._queue_lines.items():
+            line.set_visible(show_all or name == self.current_chart_facility)
+        self.refresh_queue_legend()
+    
+    def on_disp_skip_change(self, value: str):
+        """
+        处理图表刷新间隔滑块变化
+        参数:
+            value: 滑块当前值
+        """
+        self.disp_skip = max(1, int(float(value)))
+    
+    def on_chart_tab_change(self, event):
+        """
+        处理图表标签页切换，立即刷新新显示的图表
+        """
+        self._active_tab = self.chart_notebook.index("current")
+        self.sync_history_subscriptions()
+        self._chart_updaters[self._active_tab]()
+    
+    def sync_history_subscriptions(self):
+        """
+        排队图表标签页显示时订阅各设施的排队历史，隐藏时取消订阅
+        """
+        subscribed = self._active_tab == 0
+        if subscribed == self._history_subscribed:
+            return
+        self._history_subscribed = subscribed
+        for facility in self.facilities.values():
+            if subscribed:
+                facility.subscribe_history()
+            else:
+                facility.unsubscribe_history()
     
     def update_charts(self):
         """
-        更新所有图表
+        更新图表，隐藏的标签页不更新
+        """
+        self._chart_updaters[self._active_tab]()
+    
+    def get_history(self, facility_name: str) -> Optional[RingBuffer]:
+        """
+        获取用于显示的设施历史数据
+        高频缓冲区未写满时即包含全部历史；写满后改用覆盖时长更长的低频缓冲区
+        参数:
+            facility_name: 设施名称
+        返回:
+            历史数据缓冲区，设施不存在时返回None
         """
-        self.update_queue_chart()
-        self.update_heatmap_chart()
-        self.update_utilization_gauge()
+        history = self.history.get(facility_name)
+        if history is not None and len(history) == history.capacity:
+            return self.history_lowres[facility_name]
+        return history
     
     def update_queue_chart(self):
         """
         更新排队长度折线图
         """
-        self.queue_ax.clear()
-        self.queue_ax.set_title("实时排队长度折线图")
-        self.queue_ax.set_xlabel("时间")
-        self.queue_ax.set_ylabel("排队人数")
-        self.queue_ax.grid(True)
-        
-        colors = get_available_colors(len(self.facilities))
-        current_time = time.time()
-        
-        if self.current_chart_facility == "所有设施":
-            # 显示所有设施
-            for i, (name, history) in enumerate(self.queue_history.items()):
-                if len(history) > 0:
-                    times = [(t - self.start_time) for t, _ in history]
-                    values = [v for _, v in history]
-                    self.queue_ax.plot(times, values, label=name, color=colors[i % len(colors)])
-            self.queue_ax.legend()
-        else:
-            # 显示单个设施
-            if self.current_chart_facility in self.queue_history:
-                history = self.queue_history[self.current_chart_facility]
-                if len(history) > 0:
-                    times = [(t - self.start_time) for t, _ in history]
-                    values = [v for _, v in history]
-                    self.queue_ax.plot(times, values, label=self.current_chart_facility, color=colors[0])
-                    self.queue_ax.legend()
-        
-        # 设置x轴标签格式
-        import matplotlib.dates as mdates
-        from datetime import datetime, timedelta
-        
-        # 转换时间显示格式
-        def format_time(x, pos=None):
-            seconds = int(x)
-            mins, secs = divmod(seconds, 60)
-            return f"{mins}:{secs:02d}"
-        
-        self.queue_ax.xaxis.set_major_formatter(format_time)
-        
-        # 只显示最近100个数据点的标签
-        for label in self.queue_ax.get_xticklabels():
-            label.set_fontsize(8)
+        x_max = 0.0
+        y_max = 0.0
+        for name, line in self._queue_lines.items():
+            history = self.get_history(name)
+            if not line.get_visible() or not history:
+                continue
+            times, values = history.view("q")
+            times = times - self.start_time
+            line.set_data(times, values)
+            x_max = max(x_max, times[-1])
+            y_max = max(y_max, values.max())
+        
+        # 数据超出坐标范围时才扩展坐标轴，完整重绘后在draw_event中重新缓存背景
+        _, x_limit = self.queue_ax.get_xlim()
+        _, y_limit = self.queue_ax.get_ylim()
+        if x_max > x_limit or y_max > y_limit:
+            self.queue_ax.set_xlim(0, max(x_limit, x_max * 1.5))
+            self.queue_ax.set_ylim(0, max(y_limit, y_max * 1.5))
+            self.queue_canvas.draw()
+            return
         
-        self.queue_fig.tight_layout()
-        self.queue_canvas.draw()
+        self.blit_queue_lines()
+        self.queue_canvas.flush_events()
     
     def update_heatmap_chart(self):
         """
         更新等待时间热力图
         """
-        # 这里简化处理，实际应该计算不同时间段的平均等待时间
-        self.heatmap_ax.clear()
-        self.heatmap_ax.set_title("游客平均等待时间热力图")
+        current_time = time.monotonic()
+        facility_names = tuple(self.facilities)
+        names_changed = facility_names != self._heatmap_names
         
-        if not self.facilities:
+        # 设施没有变化时按热力图更新间隔刷新
+        if not names_changed and current_time - self._last_heatmap < self.heatmap_update_interval / 1000:
+            return
+        self._last_heatmap = current_time
+        
+        slot_count = len(self.heatmap_time_slots)
+        if names_changed:
+            # 设施变化时才重建缓冲区、网格、坐标轴标签和数值标注
+            column_count = max(1, len(facility_names))
+            self._heatmap_names = facility_names
+            self._heatmap_buf = np.zeros((slot_count, column_count))
+            self._heatmap_mesh.remove()
+            self._heatmap_mesh = self.heatmap_ax.pcolormesh(self._heatmap_buf, cmap="Reds", animated=True)
+            self.heatmap_ax.set_xlim(0, column_count)
+            self.heatmap_ax.set_ylim(slot_count, 0)
+            self.heatmap_ax.set_xticks(np.arange(len(facility_names)) + 0.5)
+            self.heatmap_ax.set_xticklabels(facility_names, rotation=45, ha="right", fontsize=8)
+            for row in self._heatmap_texts:
+                for text in row:
+                    text.remove()
+            if slot_count * len(facility_names) <= self.heatmap_label_limit:
+                self._heatmap_texts = [
+                    [self.heatmap_ax.text(j + 0.5, i + 0.5, "", ha="center", va="center", color="black", fontsize=6,
+                                          animated=True)
+                     for j in range(len(facility_names))]
+                    for i in range(slot_count)
+                ]
+            else:
+                self._heatmap_texts = []
+        
+        # 按模拟开始后的10分钟时段统计各设施的平均等待时间，所有设施的采样合并后一次分箱
+        buf = self._heatmap_buf
+        views = [self.get_history(name).view("w") for name in facility_names]
+        lengths = [len(times) for times, _ in views]
+        if views:
+            times = np.concatenate([times for times, _ in views]) - self.start_time
+            waits = np.concatenate([waits for _, waits in views])
+        else:
+            times = waits = np.empty(0)
+        columns = np.repeat(np.arange(len(views)), lengths)
+        bin_waiting_times(times, waits, columns, self._heatmap_edges, buf)
+        buf /= 60.0  # 秒转换为分钟
+        
+        self._heatmap_mesh.set_array(buf.ravel())
+        clim = (buf.min(), buf.max())
+        clim_changed = clim != self._heatmap_mesh.get_clim()
+        self._heatmap_mesh.set_clim(*clim)
+        
+        # 只标注有明显等待时间的单元格
+        for i, row in enumerate(self._heatmap_texts):
+            for j, text in enumerate(row):
+                value = buf[i, j]
+                if value >= self.heatmap_label_min:
+                    text.set_text(f"{value:.1f}")
+                    text.set_visible(True)
+                else:
+                    text.set_visible(False)
+        
+        # 颜色范围或坐标轴变化时需要完整重绘颜色条和刻度，否则只局部重绘网格
+        if names_changed or clim_changed:
+            self._heatmap_cbar.update_normal(self._heatmap_mesh)
             self.heatmap_canvas.draw()
             return
         
-        # 生成示例数据
-        facility_names = list(self.facilities.keys())
-        time_slots = ["0-10分钟", "10-20分钟", "20-30分钟", "30-40分钟", "40-50分钟", "50-60分钟"]
-        
-        # 模拟等待时间数据
-        import numpy as np
-        data = np.random.randint(0, 60, size=(len(time_slots), len(facility_names))) / 10
-        
-        # 绘制热力图
-        im = self.heatmap_ax.imshow(data, cmap="Reds")
-        
-        # 设置标签
-        self.heatmap_ax.set_xticks(np.arange(len(facility_names)))
-        self.heatmap_ax.set_yticks(np.arange(len(time_slots)))
-        self.heatmap_ax.set_xticklabels(facility_names, rotation=45, ha="right", fontsize=8)
-        self.heatmap_ax.set_yticklabels(time_slots, fontsize=8)
-        
-        # 添加颜色条
-        cbar = self.heatmap_fig.colorbar(im, ax=self.heatmap_ax)
-        cbar.set_label("平均等待时间(分钟)")
-        
-        # 在热力图上标注数值
-        for i in range(len(time_slots)):
-            for j in range(len(facility_names)):
-                text = self.heatmap_ax.text(j, i, f"{data[i, j]:.1f}",
-                                         ha="center", va="center", color="black", fontsize=6)
-        
-        self.heatmap_fig.tight_layout()
-        self.heatmap_canvas.draw()
+        self.blit_heatmap()
+        self.heatmap_canvas.flush_events()
     
     def update_utilization_gauge(self):
         """
         更新设施利用率仪表盘
         """
-        # 清空现有内容
-        for widget in self.gauge_content_frame.winfo_children():
-            widget.destroy()
-        
+        # 设施变化时只增删对应的卡片
+        if self._gauge_cards.keys() != self.facilities.keys():
+            self.sync_utilization_cards()
+        
+        # 只修改数值有变化的标签
+        gauge_texts = self._gauge_texts
+        for name, (_, utilization_label) in self._gauge_cards.items():
+            utilization = self.facilities[name].get_utilization()
+            text = f"{utilization:.1f}%"
+            if gauge_texts.get(name) != text:
+                gauge_texts[name] = text
+                utilization_label.configure(text=text, foreground=get_utilization_color(utilization))
+    
+    def sync_utilization_cards(self):
+        """
+        按当前设施增删利用率卡片并重新排列网格
+        移除的卡片不销毁，从网格中隐藏后放回卡片池，新增设施时优先复用
+        """
+        for name in self._gauge_cards.keys() - self.facilities.keys():
+            card = self._gauge_cards.pop(name)
+            self._gauge_texts.pop(name, None)
+            card[0].grid_forget()
+            self._gauge_pool.append(card)
+        
+        for name in self.facilities.keys() - self._gauge_cards.keys():
+            if self._gauge_pool:
+                gauge_card, utilization_label = self._gauge_pool.pop()
+                gauge_card.configure(text=name)
+            else:
+                # 创建设施利用率卡片，数值由update_utilization_gauge填写
+                gauge_card = ttk.LabelFrame(self.gauge_content_frame, text=name, padding="10")
+                utilization_label = ttk.Label(gauge_card, font=('SimHei', 16, 'bold'))
+                utilization_label.pack(pady=10)
+            self._gauge_cards[name] = (gauge_card, utilization_label)
+        
+        # 没有设施时显示提示
         if not self.facilities:
-            ttk.Label(self.gauge_content_frame, text="暂无设施数据").pack(pady=20)
+            self._gauge_empty_label.pack(pady=20)
             return
+        self._gauge_empty_label.pack_forget()
         
-        # 创建一个网格布局
+        # 按设施顺序排列卡片，网格布局每行max_cols个
         max_cols = 3
-        row = 0
-        col = 0
-        
-        for facility in self.facilities.values():
-            utilization = facility.get_utilization()
-            color = get_utilization_color(utilization)
-            
-            # 创建设施利用率卡片
-            gauge_card = ttk.LabelFrame(self.gauge_content_frame, text=facility.name, padding="10")
-            gauge_card.grid(row=row, column=col, padx=5, pady=5, sticky="nsew")
-            
-            # 利用率文本
-            utilization_label = ttk.Label(
-                gauge_card,
-                text=f"{utilization:.1f}%",
-                foreground=color,
-                font=('SimHei', 16, 'bold')
-            )
-            utilization_label.pack(pady=10)
-            
-            # 更新网格位置
-            col += 1
-            if col >= max_cols:
-                col = 0
-                row += 1
-        
-        # 设置网格权重
-        for i in range(row + 1):
-            self.gauge_content_frame.rowconfigure(i, weight=1)
+        self._gauge_cards = {name: self._gauge_cards[name] for name in self.facilities}
+        for index, (gauge_card, _) in enumerate(self._gauge_cards.values()):
+            gauge_card.grid(row=index // max_cols, column=index % max_cols, padx=5, pady=5, sticky="nsew")
+        
+        # 设置网格权重，卡片减少后多余的行不再占用空间
+        rows = (len(self._gauge_cards) - 1) // max_cols + 1
+        for i in range(max(rows, self._gauge_rows)):
+            self.gauge_content_frame.rowconfigure(i, weight=1 if i < rows else 0)
+        self._gauge_rows = rows
         for i in range(max_cols):
             self.gauge_content_frame.columnconfigure(i, weight=1)
     
@@ -974,8 +1527,9 @@ class ThemeParkGUI:
         # 导出数据
         filename = export_to_excel(
             list(self.facilities.values()),
-            self.queue_history,
-            self.utilization_history
+            {name: self.get_history(name).pairs("q") for name in self.history},
+            {name: self.get_history(name).pairs("u") for name in self.history},
+            clock_offset=time.time() - time.monotonic()
         )
         
         if filename:
@@ -19,19 +19,21 @@ def main():
     app = ThemeParkGUI(root)
     
     # 设置窗口关闭事件
-    root.protocol("WM_DELETE_WINDOW", lambda: on_closing(root))
+    root.protocol("WM_DELETE_WINDOW", lambda: on_closing(root, app))
     
     # 启动主循环
     root.mainloop()
 
 
-def on_closing(root):
+def on_closing(root, app):
     """
     处理窗口关闭事件
     参数:
         root: 根窗口
+        app: 模拟器界面
     """
-    # 这里可以添加清理代码
+    # 写入尚未保存的布局修改
+    app.flush_save_layout()
     root.destroy()
 
 
@@ -6,9 +6,12 @@
 """
 import unittest
 import time
-from facility import Facility, FacilityFactory
-from visitor import Visitor
-from data_structures import FacilityQueue, PlanStack, CommandStack, EventQueue
+import numpy as np
+from facility import Facility, FacilityFactory, FacilityIndex
+from visitor import Status, Visitor, VisitorGenerator
+from visitor_soa import VISITOR_IDLE, VISITOR_MOVING, step_visitors, tick_visitors
+from data_structures import FacilityQueue, PlanStack, Command, CommandStack, EventQueue, CalendarQueue, RingBuffer
+import utils
 
 
 class TestDataStructures(unittest.TestCase):
@@ -35,6 +38,50 @@ class TestDataStructures(unittest.TestCase):
         # 测试空队列弹出
         self.assertIsNone(queue.pop())
     
+    def test_facility_queue_drain(self):
+        """
+        测试设施队列批量取出到预分配的列表
+        """
+        queue = FacilityQueue()
+        for i in range(5):
+            queue.append(f"游客{i}")
+        
+        buffer = [None] * 3
+        self.assertEqual(queue.drain_into(buffer, 3), 3)
+        self.assertEqual(buffer, ["游客0", "游客1", "游客2"])
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.size, 2)
+        
+        # 请求数量超过队列长度时只取出剩余元素，其余槽位保持不变
+        self.assertEqual(queue.drain_into(buffer, 3), 2)
+        self.assertEqual(buffer, ["游客3", "游客4", "游客2"])
+        self.assertEqual(queue.drain_into(buffer, 1), 0)
+        self.assertEqual(len(queue), 0)
+    
+    def test_ring_buffer(self):
+        """
+        测试统计历史环形缓冲区
+        """
+        buf = RingBuffer(capacity=4)
+        self.assertEqual(len(buf), 0)
+        
+        # 未写满时按写入顺序返回
+        buf.push(1.0, 5, 0.5, 10.0)
+        buf.push(2.0, 6, 0.25)
+        times, values = buf.view("q")
+        self.assertEqual(times.tolist(), [1.0, 2.0])
+        self.assertEqual(values.tolist(), [5.0, 6.0])
+        self.assertEqual(list(buf.pairs("w")), [(1.0, 10.0), (2.0, 0.0)])
+        
+        # 写满后覆盖最旧的数据，仍按时间顺序返回
+        for i in range(3, 7):
+            buf.push(float(i), i, 0.0)
+        self.assertEqual(len(buf), 4)
+        times, values = buf.view("q")
+        self.assertEqual(times.tolist(), [3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(values.tolist(), [3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(list(buf.pairs("q", chunk=3)), [(3.0, 3.0), (4.0, 4.0), (5.0, 5.0), (6.0, 6.0)])
+    
     def test_plan_stack(self):
         """
         测试行程单栈功能
@@ -47,6 +94,7 @@ class TestDataStructures(unittest.TestCase):
         stack.push("摩天轮")
         self.assertEqual(len(stack), 2)
         self.assertEqual(stack.peek(), "摩天轮")
+        self.assertEqual(list(stack), ["摩天轮", "过山车"])  # 从栈顶到栈底
         
         # 测试弹出元素
         self.assertEqual(stack.pop(), "摩天轮")
@@ -56,6 +104,11 @@ class TestDataStructures(unittest.TestCase):
         # 测试空栈操作
         self.assertIsNone(stack.pop())
         self.assertIsNone(stack.peek())
+        
+        # 测试一次性载入，第一个元素在栈顶
+        stack.load(["过山车", "摩天轮", "旋转木马"])
+        self.assertEqual(stack.peek(), "过山车")
+        self.assertEqual(list(stack), ["过山车", "摩天轮", "旋转木马"])
     
     def test_command_stack(self):
         """
@@ -93,6 +146,64 @@ class TestDataStructures(unittest.TestCase):
         self.assertTrue(stack.can_undo())
         self.assertFalse(stack.can_redo())
     
+    def test_command_stack_max_size(self):
+        """
+        测试命令栈超出容量时丢弃最旧记录
+        """
+        stack = CommandStack(max_size=2)
+        log = []
+        for i in range(3):
+            stack.push(lambda i=i: log.append(i), lambda: None)
+        
+        # 只保留最近2步
+        self.assertTrue(stack.undo())
+        self.assertTrue(stack.undo())
+        self.assertFalse(stack.undo())
+        self.assertEqual(log, [2, 1])
+    
+    def test_command_stack_dispatch(self):
+        """
+        测试命令栈按命令类型分派Command
+        """
+        items = set()
+        stack = CommandStack(handlers={"add": items.add, "remove": items.discard})
+        
+        items.add("过山车")
+        stack.push(Command("remove", "过山车"), Command("add", "过山车"))
+        
+        self.assertTrue(stack.undo())
+        self.assertEqual(items, set())
+        self.assertTrue(stack.redo())
+        self.assertEqual(items, {"过山车"})
+    
+    def test_command_stack_failed_command(self):
+        """
+        测试处理函数抛出异常后撤销/重做函数仍然成对
+        """
+        def fail(payload):
+            raise RuntimeError(payload)
+        
+        log = []
+        stack = CommandStack(handlers={"log": log.append, "fail": fail})
+        stack.push(Command("log", "撤销1"), Command("log", "重做1"))
+        stack.push(Command("fail", "撤销2"), Command("log", "重做2"))
+        
+        # 失败的操作整体丢弃，不影响更早的记录
+        with self.assertRaises(RuntimeError):
+            stack.undo()
+        self.assertTrue(stack.undo())
+        self.assertTrue(stack.redo())
+        self.assertEqual(log, ["撤销1", "重做1"])
+        self.assertFalse(stack.can_redo())
+        
+        stack.push(Command("log", "撤销3"), Command("fail", "重做3"))
+        self.assertTrue(stack.undo())
+        with self.assertRaises(RuntimeError):
+            stack.redo()
+        self.assertTrue(stack.undo())
+        self.assertTrue(stack.redo())
+        self.assertEqual(log, ["撤销1", "重做1", "撤销3", "撤销1", "重做1"])
+    
     def test_event_queue(self):
         """
         测试事件队列功能
@@ -120,6 +231,88 @@ class TestDataStructures(unittest.TestCase):
         self.assertEqual(data3["id"], 2)
         
         self.assertTrue(queue.is_empty())
+    
+    def test_event_queue_extend(self):
+        """
+        测试事件队列批量添加
+        """
+        queue = EventQueue()
+        queue.push(7, "设施完成", {"name": "过山车"})
+        queue.extend([
+            (10, "游客到达", {"id": 1}),
+            (3, "游客到达", {"id": 2}),
+            (10, "游客到达", {"id": 3}),
+        ])
+        self.assertEqual(len(queue), 4)
+        
+        # 按时间排序，时间相同按添加顺序
+        popped = [queue.pop() for _ in range(4)]
+        self.assertEqual([t for t, _, _ in popped], [3, 7, 10, 10])
+        self.assertEqual(popped[2][2]["id"], 1)
+        self.assertEqual(popped[3][2]["id"], 3)
+        self.assertTrue(queue.is_empty())
+    
+    def test_event_queue_reschedule(self):
+        """
+        测试事件队列修改事件时间
+        """
+        queue = EventQueue()
+        early = queue.push(5, "设施完成", {"name": "过山车"})
+        queue.push(10, "游客到达", {"id": 1})
+        late = queue.push(20, "设施完成", {"name": "摩天轮"})
+        
+        # 推迟最早的事件，提前最晚的事件
+        self.assertTrue(queue.reschedule(early, 30))
+        self.assertTrue(queue.reschedule(late, 1))
+        
+        self.assertEqual(queue.pop(), (1, "设施完成", {"name": "摩天轮"}))
+        self.assertEqual(queue.pop()[0], 10)
+        self.assertEqual(queue.pop(), (30, "设施完成", {"name": "过山车"}))
+        
+        # 已弹出的事件无法修改
+        self.assertFalse(queue.reschedule(early, 40))
+    
+    def test_event_queue_cancel(self):
+        """
+        测试事件队列取消事件
+        """
+        queue = EventQueue()
+        first = queue.push(5, "设施完成", {"name": "过山车"})
+        second = queue.push(10, "游客到达", {"id": 1})
+        queue.push(15, "游客到达", {"id": 2})
+        
+        self.assertTrue(queue.cancel(first))
+        self.assertFalse(queue.cancel(first))  # 不能重复取消
+        self.assertFalse(queue.reschedule(first, 1))
+        self.assertEqual(len(queue), 2)
+        
+        # 弹出时跳过已取消的事件
+        self.assertEqual(queue.pop()[2]["id"], 1)
+        self.assertFalse(queue.cancel(second))  # 已弹出的事件无法取消
+        self.assertEqual(queue.pop()[2]["id"], 2)
+        self.assertTrue(queue.is_empty())
+        self.assertIsNone(queue.pop())
+    
+    def test_calendar_queue(self):
+        """
+        测试日历队列功能
+        """
+        queue = CalendarQueue(bucket_width=1.0, bucket_count=4)
+        self.assertTrue(queue.is_empty())
+        
+        # 添加足够多的事件以触发扩容，时间跨度超过一整轮桶
+        times = [7.5, 0.2, 3.3, 12.0, 3.3, 0.9, 25.1, 5.0, 1.4, 9.9]
+        for i, t in enumerate(times):
+            queue.push(t, "游客到达", {"id": i})
+        self.assertEqual(len(queue), len(times))
+        
+        # 按时间顺序弹出，时间相同按添加顺序
+        expected = sorted(range(len(times)), key=lambda i: (times[i], i))
+        popped = [queue.pop()[2]["id"] for _ in range(len(times))]
+        self.assertEqual(popped, expected)
+        
+        self.assertTrue(queue.is_empty())
+        self.assertIsNone(queue.pop())
 
 
 class TestSimulationCore(unittest.TestCase):
@@ -144,6 +337,41 @@ class TestSimulationCore(unittest.TestCase):
         self.assertEqual(factory_facility.name, "摩天轮")
         self.assertEqual(factory_facility.type, "摩天轮")
         self.assertEqual(factory_facility.emoji, "🎡")
+        
+        # 未知类型使用默认emoji
+        unknown_facility = FacilityFactory.create_facility(
+            "神秘屋", "鬼屋", 10, 60, 2, 2
+        )
+        self.assertEqual(unknown_facility.emoji, "🎪")
+        
+        # 设施类型配置只读
+        with self.assertRaises(TypeError):
+            FacilityFactory.FACILITY_TYPES["鬼屋"] = {"emoji": "👻"}
+        with self.assertRaises(TypeError):
+            FacilityFactory.get_type_info("过山车")["default_capacity"] = 1
+        self.assertEqual(FacilityFactory.get_type_info("过山车")["default_capacity"], 20)
+        self.assertEqual(len(FacilityFactory.get_type_info("鬼屋")), 0)
+    
+    def test_facility_dict_round_trip(self):
+        """
+        测试设施与字典互相转换
+        """
+        facility = FacilityFactory.create_facility("海盗船", "海盗船", 24, 110, 6, 6)
+        facility.move(7, 8)
+        data = facility.to_dict()
+        self.assertEqual(data, {
+            "name": "海盗船", "capacity": 24, "run_time": 110,
+            "x": 7, "y": 8, "type": "海盗船", "emoji": "⛵"
+        })
+        
+        restored = Facility.from_dict(data)
+        self.assertEqual(restored.spec, facility.spec)
+        self.assertEqual((restored.x, restored.y), (7, 8))
+        self.assertEqual(restored.get_queue_length(), 0)
+        
+        # 布局文件中多余的键被忽略
+        restored = Facility.from_dict(dict(data, note="备注"))
+        self.assertEqual(restored.spec, facility.spec)
     
     def test_visitor_plan(self):
         """
@@ -154,18 +382,141 @@ class TestSimulationCore(unittest.TestCase):
         
         # 测试行程栈初始化
         self.assertEqual(visitor.get_next_destination(), "过山车")
+        self.assertEqual(visitor.get_remaining_plan(), plan)
+        self.assertEqual(visitor.get_status_text(), "下一站：过山车")
+        visitor.start_waiting(10.0)
+        self.assertEqual(visitor.get_status_text(), "等待：过山车")
+        
+        # 时间由调用方传入，等待和游玩时长是确定的
+        self.assertEqual(visitor.end_waiting(25.0), 15.0)
+        visitor.start_ride(25.0)
+        self.assertEqual(visitor.get_status_text(), "游玩：过山车")
         
         # 测试完成一个设施后更新行程
-        visitor.end_ride()
+        self.assertEqual(visitor.end_ride(85.0), 60.0)
         self.assertEqual(visitor.get_next_destination(), "摩天轮")
         self.assertEqual(len(visitor.plan_stack), 2)
+        self.assertEqual((visitor.total_waiting_time, visitor.total_ride_time), (15.0, 60.0))
+        self.assertTrue(visitor.has_visited("过山车"))
+        self.assertFalse(visitor.has_visited("摩天轮"))
         
-        visitor.end_ride()
+        visitor.end_ride(90.0)
         self.assertEqual(visitor.get_next_destination(), "旋转木马")
         
-        visitor.end_ride()
+        visitor.end_ride(95.0)
         self.assertIsNone(visitor.get_next_destination())
         self.assertEqual(visitor.status, "完成")
+        self.assertEqual(visitor.get_status_text(), "行程结束")
+        self.assertEqual(visitor.visited_facilities, set(plan))
+        self.assertCountEqual(visitor.to_dict()["visited_facilities"], plan)
+    
+    def test_facility_index(self):
+        """
+        测试设施位索引按实例隔离，释放的位索引被复用
+        """
+        index = FacilityIndex()
+        self.assertEqual([index.register(name) for name in ("过山车", "摩天轮", "旋转木马")], [0, 1, 2])
+        self.assertEqual(index.register("摩天轮"), 1)
+        
+        # 释放后新设施复用最小的空闲位，位掩码不会变宽
+        self.assertEqual(index.release("过山车"), 0)
+        self.assertEqual(index.release("摩天轮"), 1)
+        self.assertIsNone(index.release("摩天轮"))
+        self.assertEqual(index.register("碰碰车"), 0)
+        self.assertEqual(index.register("海盗船"), 1)
+        self.assertEqual(index.register("跳楼机"), 3)
+        self.assertEqual(index.names(0b101), ["旋转木马", "碰碰车"])
+        
+        # 每个游客生成器（乐园）持有独立的索引
+        generator = VisitorGenerator(facility_index=index)
+        visitor = generator.generate_visitor(0, 0, ["跳楼机"])
+        visitor.end_ride(1.0)
+        self.assertIs(visitor.facility_index, index)
+        self.assertEqual(visitor.visited_mask, 1 << 3)
+        self.assertIsNone(VisitorGenerator().facility_index.get("跳楼机"))
+    
+    def test_step_visitors(self):
+        """
+        测试游客批量移动与Visitor.move_towards结果一致
+        """
+        starts = [(0, 0), (5, 2), (3, 7), (4, 4)]
+        target = (3, 4)
+        visitors = [Visitor(i, x, y) for i, (x, y) in enumerate(starts)]
+        
+        xy = np.array(starts, dtype=np.int32)
+        tgt = np.array([target] * len(starts), dtype=np.int32)
+        st = np.array([VISITOR_MOVING, VISITOR_MOVING, VISITOR_MOVING, VISITOR_IDLE], dtype=np.int8)
+        arrived = np.zeros(len(starts), dtype=bool)
+        
+        for _ in range(8):
+            expected = [visitor.move_towards(*target) if moving else False
+                        for visitor, moving in zip(visitors, st == VISITOR_MOVING)]
+            step_visitors(xy, tgt, st, arrived)
+            self.assertEqual(arrived.tolist(), expected)
+            self.assertEqual(xy.tolist()[:3], [[v.x, v.y] for v in visitors[:3]])
+        
+        # 不移动的游客位置保持不变
+        self.assertEqual(xy[3].tolist(), [4, 4])
+    
+    def test_tick_visitors(self):
+        """
+        测试一个模拟步内的批量移动和到达后的状态转换
+        """
+        generator = VisitorGenerator()
+        visitors = [generator.generate_visitor(x, 0, ["过山车"]) for x in (0, 2, 3)]
+        tgt = np.array([(2, 0)] * 3, dtype=np.int16)
+        st = np.array([VISITOR_MOVING, VISITOR_MOVING, VISITOR_IDLE], dtype=np.int8)
+        arrived = np.zeros(3, dtype=bool)
+        
+        moved = tick_visitors(generator.arrays, tgt, st, 100.0, arrived)
+        self.assertEqual(moved.tolist(), [True, False, False])
+        self.assertEqual(arrived.tolist(), [False, True, False])
+        self.assertEqual(visitors[0].x, 1)
+        
+        # 到达的游客转为等待并停止移动，不移动的游客状态不变
+        self.assertEqual(visitors[1].status, "等待")
+        self.assertEqual(visitors[1].waiting_start_time, 100.0)
+        self.assertEqual(st.tolist(), [VISITOR_MOVING, VISITOR_IDLE, VISITOR_IDLE])
+        self.assertEqual(visitors[2].status, "自由")
+    
+    def test_visitor_arrays(self):
+        """
+        测试生成器中的游客共用结构数组，游客对象是数组视图
+        """
+        generator = VisitorGenerator(capacity=1)
+        visitors = [generator.generate_visitor(i, 2 * i, ["过山车"]) for i in range(3)]
+        arrays = generator.arrays
+        
+        # 容量不足时自动扩容，已有游客数据保留
+        self.assertEqual(len(arrays), 3)
+        self.assertEqual([visitor.index for visitor in visitors], [0, 1, 2])
+        self.assertEqual(arrays.xy[:3].tolist(), [[0, 0], [1, 2], [2, 4]])
+        
+        # 修改数组后对象属性同步变化，反之亦然
+        arrays.xy[1] = (5, 6)
+        self.assertEqual((visitors[1].x, visitors[1].y), (5, 6))
+        visitors[2].start_waiting()
+        self.assertEqual(arrays.status[2], Status.WAITING)
+        self.assertEqual(visitors[2].status, "等待")
+        self.assertEqual(visitors[0].status_code, Status.FREE)
+    
+    def test_generate_batch_seed(self):
+        """
+        测试指定随机数种子后批量生成的行程可复现
+        """
+        names = ["过山车", "摩天轮", "旋转木马"]
+        plans = [
+            [visitor.get_remaining_plan() for visitor in VisitorGenerator(seed=7).generate_batch(20, 0, 0, names)]
+            for _ in range(2)
+        ]
+        self.assertEqual(plans[0], plans[1])
+        for plan in plans[0]:
+            self.assertTrue(2 <= len(plan) <= 3)
+            self.assertEqual(len(set(plan)), len(plan))
+        
+        # 没有可选设施时行程为空
+        visitor, = VisitorGenerator(seed=7).generate_batch(1, 0, 0, [])
+        self.assertFalse(visitor.has_plan())
     
     def test_facility_queue_management(self):
         """
@@ -196,7 +547,52 @@ class TestSimulationCore(unittest.TestCase):
         # 模拟运行结束
         facility._finish_run()
         self.assertEqual(len(facility.current_visitors), 0)
+        # 结束运行后槽位不再引用游客
+        self.assertEqual(facility._riders, [None] * facility.capacity)
         self.assertEqual(facility.total_visitors_served, 2)
+    
+    def test_facility_add_visitors(self):
+        """
+        测试游客批量加入排队
+        """
+        facility = Facility("碰碰车", 8, 100, 0, 0)
+        visitors = [Visitor(i, 0, 0) for i in range(5)]
+        facility.add_visitor(visitors[0])
+        facility.add_visitors(visitors[1:])
+        
+        self.assertEqual(facility.get_queue_length(), 5)
+        self.assertEqual(list(facility.waiting_queue), visitors)
+    
+    def test_queue_history_limit(self):
+        """
+        测试排队历史只保留最近1000条记录
+        """
+        facility = Facility("过山车", 20, 120, 0, 0)
+        facility.subscribe_history()
+        for t in range(1005):
+            facility.update_status(float(t))
+        
+        times, lengths = facility.queue_history
+        self.assertEqual(len(times), 1000)
+        self.assertEqual(len(lengths), 1000)
+        self.assertEqual(times[0], 5.0)
+        self.assertEqual(times[-1], 1004.0)
+    
+    def test_queue_history_subscription(self):
+        """
+        测试没有订阅时不记录排队历史
+        """
+        facility = Facility("过山车", 20, 120, 0, 0)
+        facility.update_status(1.0)
+        self.assertEqual(len(facility.queue_history[0]), 0)
+        
+        facility.subscribe_history()
+        facility.update_status(2.0)
+        facility.unsubscribe_history()
+        facility.update_status(3.0)
+        
+        times, _ = facility.queue_history
+        self.assertEqual(times.tolist(), [2.0])
 
 
 class TestStatistics(unittest.TestCase):
@@ -235,6 +631,154 @@ class TestStatistics(unittest.TestCase):
         self.assertEqual(facility.get_avg_waiting_time(), 20.0)
 
 
+class _RecordingWorksheet:
+    """记录写入行的工作表替身"""
+    def __init__(self):
+        self.rows = []
+    
+    def write_row(self, row, col, data):
+        self.rows.append((row, list(data)))
+
+
+class _RecordingWorkbook:
+    """按创建顺序记录工作表的工作簿替身"""
+    def __init__(self):
+        self.sheets = {}
+    
+    def add_worksheet(self, name):
+        self.sheets[name] = _RecordingWorksheet()
+        return self.sheets[name]
+
+
+class TestUtils(unittest.TestCase):
+    """
+    测试工具函数
+    """
+    def test_write_sheet_segments(self):
+        """
+        测试数据行超过分段大小时续写到编号递增的工作表
+        """
+        workbook = _RecordingWorkbook()
+        rows = [(i, i * 10) for i in range(5)]
+        utils._write_sheet(workbook, "数据", ("序号", "数值"), iter(rows), segment_size=2)
+        
+        self.assertEqual(list(workbook.sheets), ["数据", "数据_2", "数据_3"])
+        written = []
+        for name, count in (("数据", 2), ("数据_2", 2), ("数据_3", 1)):
+            sheet = workbook.sheets[name]
+            # 每个工作表第0行都是表头，数据从第1行开始
+            self.assertEqual(sheet.rows[0], (0, ["序号", "数值"]))
+            self.assertEqual([row for row, _ in sheet.rows[1:]], list(range(1, count + 1)))
+            written.extend(tuple(data) for _, data in sheet.rows[1:])
+        self.assertEqual(written, rows)
+        
+        # 恰好写满一段时不创建空的续表
+        workbook = _RecordingWorkbook()
+        utils._write_sheet(workbook, "数据", ("序号", "数值"), iter(rows[:2]), segment_size=2)
+        self.assertEqual(list(workbook.sheets), ["数据"])
+    
+    def test_bin_waiting_times(self):
+        """
+        测试等待时间分箱与逐设施bincount循环结果一致
+        """
+        slot_count, column_count = 6, 3
+        edges = np.arange(slot_count + 1) * 600.0
+        
+        def reference(times, values, columns):
+            # 原先逐设施分箱的实现
+            out = np.zeros((slot_count, column_count))
+            for j in range(column_count):
+                mask = columns == j
+                slots = (times[mask] // 600).astype(np.intp)
+                in_range = slots < slot_count
+                slots = slots[in_range]
+                sums = np.bincount(slots, weights=values[mask][in_range], minlength=slot_count)
+                counts = np.bincount(slots, minlength=slot_count)
+                np.divide(sums, counts, out=out[:, j], where=counts > 0)
+            return out
+        
+        # 恰好落在时段边界、超出最后一个时段、以及没有采样的设施
+        times = np.array([0.0, 599.9, 600.0, 1200.0, 3599.9, 3600.0, 5000.0, 600.0, 1800.5])
+        values = np.array([10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0])
+        columns = np.array([0, 0, 0, 0, 0, 0, 0, 1, 1])
+        out = np.full((slot_count, column_count), -1.0)
+        result = utils.bin_waiting_times(times, values, columns, edges, out)
+        self.assertIs(result, out)
+        np.testing.assert_allclose(out, reference(times, values, columns))
+        self.assertEqual(out[0, 0], 15.0)
+        self.assertEqual(out[1, 0], 30.0)
+        self.assertEqual(out[5, 0], 50.0)
+        self.assertFalse(out[:, 2].any())
+        
+        # 没有任何采样时输出全为0
+        empty = np.empty(0)
+        utils.bin_waiting_times(empty, empty, np.empty(0, dtype=np.intp), edges, out)
+        self.assertFalse(out.any())
+    
+    def test_time_formatter(self):
+        """
+        测试时间格式化函数在同一秒内复用结果，跨秒后重新格式化
+        """
+        offset = 1_700_000_000.0
+        format_time = utils._time_formatter(offset)
+        
+        first = format_time(5.1)
+        self.assertEqual(first, time.strftime("%H:%M:%S", time.localtime(int(offset) + 5)))
+        # 同一秒内返回同一个字符串对象
+        self.assertIs(format_time(5.9), first)
+        
+        # 下一秒生成新的字符串
+        second = format_time(6.0)
+        self.assertEqual(second, time.strftime("%H:%M:%S", time.localtime(int(offset) + 6)))
+        self.assertNotEqual(second, first)
+        self.assertIs(format_time(6.5), second)
+    
+    def test_calculate_distances_batch(self):
+        """
+        测试批量距离矩阵与逐对计算的曼哈顿距离一致
+        """
+        rng = np.random.default_rng(0)
+        xs = rng.integers(0, 16, 20).astype(np.int16)
+        ys = rng.integers(0, 16, 20).astype(np.int16)
+        fx = rng.integers(0, 16, 5)
+        fy = rng.integers(0, 16, 5)
+        
+        distances = utils.calculate_distances_batch(xs, ys, fx, fy)
+        self.assertEqual(distances.shape, (20, 5))
+        for i in range(20):
+            for j in range(5):
+                self.assertEqual(distances[i, j],
+                                 utils.calculate_distance(int(xs[i]), int(ys[i]), int(fx[j]), int(fy[j])))
+        
+        # 没有游客时返回空矩阵
+        empty = np.empty(0, dtype=np.int16)
+        self.assertEqual(utils.calculate_distances_batch(empty, empty, fx, fy).shape, (0, 5))
+    
+    def test_generate_random_position(self):
+        """
+        测试随机位置不会落在已占用格子上，地图占满时返回(0, 0)
+        """
+        map_size = 4
+        occupied = [(x, y) for x in range(map_size) for y in range(map_size) if (x + y) % 3]
+        free = {(x, y) for x in range(map_size) for y in range(map_size)} - set(occupied)
+        self.assertEqual(utils.get_free_cells(map_size, occupied), free)
+        self.assertEqual(utils.get_free_cells(map_size, np.array(occupied)), free)
+        for _ in range(50):
+            self.assertIn(utils.generate_random_position(map_size, occupied), free)
+        
+        # 传入空闲格子集合时逐个取出，不重复，取完后返回(0, 0)
+        free_cells = set(free)
+        drawn = [utils.generate_random_position(map_size, free_cells=free_cells) for _ in range(len(free))]
+        self.assertEqual(set(drawn), free)
+        self.assertEqual(free_cells, set())
+        self.assertEqual(utils.generate_random_position(map_size, free_cells=free_cells), (0, 0))
+        
+        # 地图已满时返回(0, 0)
+        full = [(x, y) for x in range(map_size) for y in range(map_size)]
+        self.assertEqual(utils.get_free_cells(map_size, full), set())
+        self.assertEqual(utils.generate_random_position(map_size, full), (0, 0))
+
+
 def run_all_tests():
     """
     运行所有测试
@@ -251,10 +795,15 @@ def run_all_tests():
     statistics_suite = unittest.TestLoader().loadTestsFromTestCase(TestStatistics)
     statistics_result = unittest.TextTestRunner(verbosity=2).run(statistics_suite)
     
+    print("\n开始测试工具函数...")
+    utils_suite = unittest.TestLoader().loadTestsFromTestCase(TestUtils)
+    utils_result = unittest.TextTestRunner(verbosity=2).run(utils_suite)
+    
     # 检查是否所有测试都通过
     all_passed = (data_structure_result.wasSuccessful() and
                  simulation_result.wasSuccessful() and
-                 statistics_result.wasSuccessful())
+                 statistics_result.wasSuccessful() and
+                 utils_result.wasSuccessful())
     
     if all_passed:
         print("\n✅ 所有测试通过！")
@@ -4,13 +4,26 @@
 创建时间: 2024-01
 功能: 实现Excel导出、JSON保存/读取等通用工具函数
 """
+import functools
+import itertools
 import json
 import os
-import pandas as pd
+import time
+import numpy as np
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple, Union, Iterable, Iterator
 from facility import Facility
 
+try:
+    import orjson  # 可选依赖，读写布局文件更快
+except ImportError:
+    orjson = None
+
+try:
+    import xlsxwriter  # 仅导出Excel时需要，未安装时其余工具函数照常可用
+except ImportError:
+    xlsxwriter = None
+
 
 def save_layout(facilities: List[Facility], filename: str = "layout.json") -> bool:
     """
@@ -22,20 +35,16 @@ def save_layout(facilities: List[Facility], filename: str = "layout.json") -> bo
         是否保存成功
     """
     try:
-        layout_data = {}
-        for facility in facilities:
-            layout_data[facility.name] = {
-                "name": facility.name,  # 添加name字段，与Facility.from_dict方法匹配
-                "x": facility.x,
-                "y": facility.y,
-                "capacity": facility.capacity,
-                "run_time": facility.run_time,
-                "type": facility.type,
-                "emoji": facility.emoji
-            }
+        # to_dict包含name字段，与Facility.from_dict方法匹配
+        layout_data = {facility.name: facility.to_dict() for facility in facilities}
         
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(layout_data, f, ensure_ascii=False, indent=2)
+        # 先在内存中序列化为UTF-8字节，再一次性写入
+        if orjson is not None:
+            data = orjson.dumps(layout_data, option=orjson.OPT_INDENT_2)
+        else:
+            data = json.dumps(layout_data, ensure_ascii=False, indent=2).encode("utf-8")
+        with open(filename, "wb") as f:
+            f.write(data)
         
         return True
     except Exception as e:
@@ -55,87 +64,143 @@ def load_layout(filename: str = "layout.json") -> Dict[str, Dict[str, Any]]:
         return {}
     
     try:
-        with open(filename, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(filename, "rb") as f:
+            data = f.read()
+        return orjson.loads(data) if orjson is not None else json.loads(data)
     except Exception as e:
         print(f"加载布局失败: {e}")
         return {}
 
 
-def export_to_excel(facilities: List[Facility], queue_history: Dict[str, List], 
-                    utilization_data: Dict[str, List], 
-                    output_dir: str = ".") -> str:
+# 单个工作表最多写入的数据行数（xlsx上限为1048576行，数据过多时Excel打开也会很慢）
+SEGMENT_SIZE = 250_000
+
+
+def _iter_facility_rows(facilities: List[Facility]) -> Iterator[tuple]:
+    """逐行生成设施基础信息"""
+    for facility in facilities:
+        yield (
+            facility.name, facility.type, facility.capacity, facility.run_time,
+            facility.x, facility.y, facility.get_queue_length(),
+            facility.get_utilization(), facility.total_visitors_served
+        )
+
+
+def _time_formatter(clock_offset: float) -> Callable[[float], str]:
+    """
+    创建时间戳到"时:分:秒"文本的格式化函数
+    历史数据按时间顺序排列，同一秒内的时间戳直接复用上一次的格式化结果
+    参数:
+        clock_offset: 加到时间戳上的时钟偏移量
+    返回:
+        格式化函数
+    """
+    last_second = None
+    last_text = ""
+    
+    def format_time(timestamp: float) -> str:
+        nonlocal last_second, last_text
+        second = int(timestamp + clock_offset)
+        if second != last_second:
+            last_second = second
+            last_text = time.strftime("%H:%M:%S", time.localtime(second))
+        return last_text
+    
+    return format_time
+
+
+def _iter_queue_rows(queue_history: Dict[str, Iterable], clock_offset: float) -> Iterator[tuple]:
+    """逐行生成排队历史数据"""
+    format_time = _time_formatter(clock_offset)
+    for facility_name, history in queue_history.items():
+        for timestamp, queue_length in history:
+            time_str = format_time(timestamp)
+            yield time_str, facility_name, queue_length
+
+
+def _iter_utilization_rows(facilities: List[Facility], utilization_data: Dict[str, Iterable],
+                           clock_offset: float) -> Iterator[tuple]:
+    """逐行生成设施利用率数据：先输出汇总行，再输出历史利用率行"""
+    for facility in facilities:
+        yield (facility.name, facility.total_run_time,
+               facility.total_idle_time, facility.get_utilization())
+    format_time = _time_formatter(clock_offset)
+    for facility_name, history in utilization_data.items():
+        for timestamp, utilization in history:
+            time_str = format_time(timestamp)
+            yield facility_name, None, None, utilization, time_str
+
+
+def _write_sheet(workbook: "xlsxwriter.Workbook", name: str, header: tuple,
+                 rows: Iterable[tuple], segment_size: int = SEGMENT_SIZE) -> None:
+    """
+    创建工作表并逐行写入，行数据来自生成器，写完一行即可丢弃
+    数据行超过segment_size时自动续写到新工作表：名称_2、名称_3……
+    参数:
+        workbook: 工作簿
+        name: 工作表名称
+        header: 表头
+        rows: 数据行
+        segment_size: 每个工作表最多写入的数据行数
+    """
+    worksheet = workbook.add_worksheet(name)
+    worksheet.write_row(0, 0, header)
+    segment = 1
+    row = 1
+    for data in rows:
+        if row > segment_size:
+            segment += 1
+            worksheet = workbook.add_worksheet(f"{name}_{segment}")
+            worksheet.write_row(0, 0, header)
+            row = 1
+        worksheet.write_row(row, 0, data)
+        row += 1
+
+
+def export_to_excel(facilities: List[Facility], queue_history: Dict[str, Iterable], 
+                    utilization_data: Dict[str, Iterable], 
+                    output_dir: str = ".", clock_offset: float = 0.0,
+                    segment_size: int = SEGMENT_SIZE) -> str:
     """
     导出模拟数据到Excel文件
     参数:
         facilities: 设施列表
-        queue_history: 排队历史数据
-        utilization_data: 利用率数据
+        queue_history: 排队历史数据，每个设施对应可迭代的(时间戳, 排队人数)
+        utilization_data: 利用率数据，每个设施对应可迭代的(时间戳, 利用率)
         output_dir: 输出目录
+        clock_offset: 历史时间戳加上该偏移后为Unix时间戳，
+                      历史数据使用time.monotonic()记录时传入time.time() - time.monotonic()
+        segment_size: 每个工作表最多写入的数据行数，超出部分写到编号递增的新工作表
     返回:
         生成的Excel文件路径
     """
+    if xlsxwriter is None:
+        print("导出Excel失败: 未安装XlsxWriter")
+        return None
+    
     try:
         # 生成文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = os.path.join(output_dir, f"simulation_{timestamp}.xlsx")
         
-        # 创建Excel写入器
-        with pd.ExcelWriter(filename, engine="openpyxl") as writer:
+        # constant_memory模式逐行写入磁盘，内存占用与数据行数无关
+        workbook = xlsxwriter.Workbook(filename, {"constant_memory": True, "strings_to_urls": False})
+        try:
             # 工作表1：设施基础信息
-            facility_data = []
-            for facility in facilities:
-                facility_data.append({
-                    "设施名称": facility.name,
-                    "设施类型": facility.type,
-                    "容量": facility.capacity,
-                    "单次运行时长": facility.run_time,
-                    "X坐标": facility.x,
-                    "Y坐标": facility.y,
-                    "当前排队人数": facility.get_queue_length(),
-                    "当前利用率": facility.get_utilization(),
-                    "总服务游客数": facility.total_visitors_served
-                })
-            
-            df_facilities = pd.DataFrame(facility_data)
-            df_facilities.to_excel(writer, sheet_name="设施基础信息", index=False)
+            _write_sheet(workbook, "设施基础信息", (
+                "设施名称", "设施类型", "容量", "单次运行时长", "X坐标", "Y坐标",
+                "当前排队人数", "当前利用率", "总服务游客数"
+            ), _iter_facility_rows(facilities), segment_size)
             
             # 工作表2：实时排队数据
-            queue_data = []
-            for facility_name, history in queue_history.items():
-                for timestamp, queue_length in history:
-                    time_str = datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
-                    queue_data.append({
-                        "时间": time_str,
-                        "设施名称": facility_name,
-                        "排队人数": queue_length
-                    })
-            
-            df_queue = pd.DataFrame(queue_data)
-            df_queue.to_excel(writer, sheet_name="实时排队数据", index=False)
+            _write_sheet(workbook, "实时排队数据", ("时间", "设施名称", "排队人数"),
+                         _iter_queue_rows(queue_history, clock_offset), segment_size)
             
             # 工作表3：设施利用率
-            utilization_rows = []
-            for facility in facilities:
-                utilization_rows.append({
-                    "设施名称": facility.name,
-                    "总运行时间": facility.total_run_time,
-                    "总空闲时间": facility.total_idle_time,
-                    "利用率(%)": facility.get_utilization()
-                })
-            
-            # 添加历史利用率数据
-            for facility_name, history in utilization_data.items():
-                for timestamp, utilization in history:
-                    time_str = datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
-                    utilization_rows.append({
-                        "设施名称": facility_name,
-                        "时间": time_str,
-                        "利用率(%)": utilization
-                    })
-            
-            df_utilization = pd.DataFrame(utilization_rows)
-            df_utilization.to_excel(writer, sheet_name="设施利用率", index=False)
+            _write_sheet(workbook, "设施利用率", ("设施名称", "总运行时间", "总空闲时间", "利用率(%)", "时间"),
+                         _iter_utilization_rows(facilities, utilization_data, clock_offset), segment_size)
+        finally:
+            workbook.close()
         
         return filename
     except Exception as e:
@@ -143,35 +208,47 @@ def export_to_excel(facilities: List[Facility], queue_history: Dict[str, List],
         return None
 
 
+def get_free_cells(map_size: int = 16,
+                   existing_positions: Union[List[tuple], np.ndarray] = None) -> Set[tuple]:
+    """
+    计算地图上未被占用的格子
+    参数:
+        map_size: 地图大小
+        existing_positions: 已存在的位置列表，或形状为(N, 2)的NumPy坐标数组
+    返回:
+        空闲格子(x, y)坐标集合
+    """
+    free_cells = {(x, y) for x in range(map_size) for y in range(map_size)}
+    if existing_positions is not None and len(existing_positions):
+        positions = np.asarray(existing_positions).reshape(-1, 2).tolist()
+        free_cells.difference_update(map(tuple, positions))
+    return free_cells
+
+
 def generate_random_position(map_size: int = 16, 
-                            existing_positions: List[tuple] = None) -> tuple:
+                            existing_positions: Union[List[tuple], np.ndarray] = None,
+                            free_cells: Optional[Set[tuple]] = None) -> tuple:
     """
     生成随机位置，避开已存在的位置
     参数:
         map_size: 地图大小
-        existing_positions: 已存在的位置列表
+        existing_positions: 已存在的位置列表，或形状为(N, 2)的NumPy坐标数组
+        free_cells: 调用方维护的空闲格子集合，提供时直接从中抽取并移除选中的格子，
+                    忽略existing_positions
     返回:
-        (x, y)坐标元组
+        (x, y)坐标元组，地图已满时返回(0, 0)
     """
     import random
     
-    if existing_positions is None:
-        existing_positions = []
-    
-    max_attempts = 100
-    for _ in range(max_attempts):
-        x = random.randint(0, map_size - 1)
-        y = random.randint(0, map_size - 1)
-        if (x, y) not in existing_positions:
-            return x, y
-    
-    # 如果尝试次数过多，返回第一个可用位置
-    for x in range(map_size):
-        for y in range(map_size):
-            if (x, y) not in existing_positions:
-                return x, y
+    # 直接从空闲格子中抽取，不再反复随机重试
+    if free_cells is None:
+        free_cells = get_free_cells(map_size, existing_positions)
+    if not free_cells:
+        return 0, 0
     
-    return 0, 0
+    position = random.choice(tuple(free_cells))
+    free_cells.discard(position)
+    return position
 
 
 def calculate_distance(x1: int, y1: int, x2: int, y2: int) -> int:
@@ -186,6 +263,47 @@ def calculate_distance(x1: int, y1: int, x2: int, y2: int) -> int:
     return abs(x1 - x2) + abs(y1 - y2)
 
 
+def calculate_distances_batch(xs: np.ndarray, ys: np.ndarray,
+                              fx: np.ndarray, fy: np.ndarray) -> np.ndarray:
+    """
+    批量计算多个游客到多个设施的曼哈顿距离
+    参数:
+        xs, ys: 游客坐标数组，形状(N,)
+        fx, fy: 设施坐标数组，形状(M,)
+    返回:
+        形状为(N, M)的距离矩阵，第i行第j列为第i个游客到第j个设施的距离；
+        按行取argmin即得到每个游客最近的设施
+    """
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    return np.abs(xs[:, None] - np.asarray(fx)[None, :]) + np.abs(ys[:, None] - np.asarray(fy)[None, :])
+
+
+def bin_waiting_times(times: np.ndarray, values: np.ndarray, columns: np.ndarray,
+                      slot_edges: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    按时段和设施统计采样平均值（等待时间热力图使用）
+    所有设施的采样拼接后一次完成分箱，没有采样的格子为0
+    参数:
+        times: 采样时间数组
+        values: 采样值数组
+        columns: 每个采样所属的设施列号
+        slot_edges: 递增的时段边界，长度为时段数+1
+        out: 输出数组，形状(时段数, 设施数)，原地写入
+    返回:
+        out
+    """
+    slot_count, column_count = out.shape
+    slots = np.searchsorted(slot_edges, times, side="right") - 1
+    valid = (slots >= 0) & (slots < slot_count)
+    cells = slots[valid] * column_count + columns[valid]
+    sums = np.bincount(cells, weights=values[valid], minlength=out.size)
+    counts = np.bincount(cells, minlength=out.size)
+    out.fill(0.0)
+    np.divide(sums, counts, out=out.reshape(-1), where=counts > 0)
+    return out
+
+
 def format_time(seconds: float) -> str:
     """
     格式化时间
@@ -215,27 +333,30 @@ def ensure_directory(directory: str) -> None:
         os.makedirs(directory)
 
 
-def get_available_colors(count: int) -> List[str]:
+# 预定义的图表颜色，确保颜色区分度高
+_BASE_COLORS = (
+    '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf',
+    '#aec7e8', '#ffbb78', '#98df8a', '#ff9896', '#c5b0d5',
+    '#c49c94', '#f7b6d2', '#c7c7c7', '#dbdb8d', '#9edae5'
+)
+
+# 利用率按每10%一档对应的颜色：80%以上绿色，50%~80%黄色，50%以下红色
+_UTILIZATION_COLORS = ("red",) * 5 + ("yellow",) * 3 + ("green",) * 2
+
+
+@functools.lru_cache(maxsize=32)
+def get_available_colors(count: int) -> Tuple[str, ...]:
     """
     获取可用的颜色列表，用于图表绘制
+    结果按数量缓存，调用方不应修改
     参数:
         count: 需要的颜色数量
     返回:
-        颜色字符串列表
-    """
-    # 预定义的颜色列表，确保颜色区分度高
-    base_colors = [
-        '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
-        '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf',
-        '#aec7e8', '#ffbb78', '#98df8a', '#ff9896', '#c5b0d5',
-        '#c49c94', '#f7b6d2', '#c7c7c7', '#dbdb8d', '#9edae5'
-    ]
-    
+        颜色字符串元组
+    """
     # 如果需要的颜色数量超过预定义列表，循环使用
-    if count <= len(base_colors):
-        return base_colors[:count]
-    else:
-        return (base_colors * (count // len(base_colors) + 1))[:count]
+    return tuple(itertools.islice(itertools.cycle(_BASE_COLORS), count))
 
 
 def get_utilization_color(utilization: float) -> str:
@@ -246,12 +367,7 @@ def get_utilization_color(utilization: float) -> str:
     返回:
         颜色字符串
     """
-    if utilization >= 80:
-        return "green"  # 高利用率，绿色
-    elif utilization >= 50:
-        return "yellow"  # 中等利用率，黄色
-    else:
-        return "red"  # 低利用率，红色
+    return _UTILIZATION_COLORS[min(max(int(utilization) // 10, 0), 9)]
 
 
 def get_queue_color(queue_length: int) -> str:
@@ -268,20 +384,22 @@ def get_queue_color(queue_length: int) -> str:
         return "black"  # 正常情况，黑色
 
 
-def create_default_facilities() -> List[Facility]:
+def create_default_facilities(now: float = None) -> List[Facility]:
     """
     创建默认设施列表
+    参数:
+        now: 当前模拟时间，所有默认设施共用该时间戳
     返回:
         设施列表
     """
     from facility import FacilityFactory
     
     default_facilities = [
-        FacilityFactory.create_facility("极速过山车", "过山车", 20, 120, 3, 3),
-        FacilityFactory.create_facility("幸福摩天轮", "摩天轮", 36, 180, 10, 3),
-        FacilityFactory.create_facility("旋转木马", "旋转木马", 16, 90, 3, 10),
-        FacilityFactory.create_facility("激情碰碰车", "碰碰车", 8, 100, 10, 10),
-        FacilityFactory.create_facility("海盗船", "海盗船", 24, 110, 6, 6)
+        FacilityFactory.create_facility("极速过山车", "过山车", 20, 120, 3, 3, now),
+        FacilityFactory.create_facility("幸福摩天轮", "摩天轮", 36, 180, 10, 3, now),
+        FacilityFactory.create_facility("旋转木马", "旋转木马", 16, 90, 3, 10, now),
+        FacilityFactory.create_facility("激情碰碰车", "碰碰车", 8, 100, 10, 10, now),
+        FacilityFactory.create_facility("海盗船", "海盗船", 24, 110, 6, 6, now)
     ]
     
     return default_facilities
\ No newline at end of file
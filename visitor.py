@@ -4,16 +4,29 @@
 创建时间: 2024-01
 功能: 定义Visitor类，包含行程单栈、移动逻辑
 """
+import random
 import time
 from typing import Optional, Dict, List, Set
 from data_structures import PlanStack
+from facility import FacilityIndex
+from visitor_soa import Status, VisitorArrays
+
+
+# 状态编码对应的状态文本，按Status取值索引
+STATUS_NAMES = ("自由", "等待", "游玩", "完成")
+STATUS_CODES = {name: Status(code) for code, name in enumerate(STATUS_NAMES)}
+# 有目标设施时各状态的气泡文本模板，按Status取值索引
+STATUS_TEMPLATES = ("下一站：{}", "等待：{}", "游玩：{}", "行程结束")
 
 
 class Visitor:
     """
     游客类，代表乐园中的一个游客
+    位置和状态保存在结构数组（VisitorArrays）中，对象只是按索引访问数组的视图
     """
-    def __init__(self, visitor_id: int, x: int, y: int, plan: List[str] = None):
+    def __init__(self, visitor_id: int, x: int, y: int, plan: List[str] = None,
+                 arrays: Optional[VisitorArrays] = None,
+                 facility_index: Optional[FacilityIndex] = None):
         """
         初始化游客
         参数:
@@ -21,29 +34,90 @@ class Visitor:
             x: 初始x坐标
             y: 初始y坐标
             plan: 游玩计划（行程单）
+            arrays: 所属的游客结构数组，为None时单独分配
+            facility_index: 所属乐园的设施位索引，为None时单独分配
         """
         self.id = visitor_id
-        self.x = x
-        self.y = y
-        self.status = "自由"
+        self.arrays = arrays if arrays is not None else VisitorArrays(1)
+        self.index = self.arrays.allocate(x, y, Status.FREE)  # 在结构数组中的行索引
         self.target_facility = None  # 当前目标设施
-        self.waiting_start_time = 0  # 开始等待的时间
         self.ride_start_time = 0  # 开始游玩的时间
         self.total_waiting_time = 0  # 总等待时间
         self.total_ride_time = 0  # 总游玩时间
-        self.visited_facilities = set()  # 已访问的设施集合
+        self.facility_index = facility_index if facility_index is not None else FacilityIndex()
+        self.visited_mask = 0  # 已访问设施的位掩码，位索引见facility_index
         self.emoji = "👤"  # 游客的emoji表示
         
         # 行程单栈
         self.plan_stack = PlanStack()
         if plan:
-            # 将行程单逆序压入栈中，使第一个设施在栈顶
-            for facility_name in reversed(plan):
-                self.plan_stack.push(facility_name)
+            # 一次性载入行程单，第一个设施在栈顶
+            self.plan_stack.load(plan)
         
         # 更新目标设施为栈顶元素
         self._update_target()
     
+    @property
+    def x(self) -> int:
+        """地图x坐标"""
+        return int(self.arrays.xy[self.index, 0])
+    
+    @x.setter
+    def x(self, value: int) -> None:
+        self.arrays.xy[self.index, 0] = value
+    
+    @property
+    def y(self) -> int:
+        """地图y坐标"""
+        return int(self.arrays.xy[self.index, 1])
+    
+    @y.setter
+    def y(self, value: int) -> None:
+        self.arrays.xy[self.index, 1] = value
+    
+    @property
+    def waiting_start_time(self) -> float:
+        """开始等待的时间"""
+        return float(self.arrays.waiting_since[self.index])
+    
+    @waiting_start_time.setter
+    def waiting_start_time(self, value: float) -> None:
+        self.arrays.waiting_since[self.index] = value
+    
+    @property
+    def status_code(self) -> Status:
+        """状态编码"""
+        return Status(self.arrays.status[self.index])
+    
+    @status_code.setter
+    def status_code(self, value: Status) -> None:
+        self.arrays.status[self.index] = value
+    
+    @property
+    def status(self) -> str:
+        """状态文本：自由/等待/游玩/完成"""
+        return STATUS_NAMES[self.arrays.status[self.index]]
+    
+    @status.setter
+    def status(self, value: str) -> None:
+        self.arrays.status[self.index] = STATUS_CODES[value]
+    
+    @property
+    def visited_facilities(self) -> Set[str]:
+        """已访问的设施集合"""
+        return set(self.facility_index.names(self.visited_mask))
+    
+    def has_visited(self, facility_name: str) -> bool:
+        """
+        检查是否访问过指定设施
+        参数:
+            facility_name: 设施名称
+        返回:
+            是否访问过
+        """
+        index = self.facility_index.get(facility_name)
+        return index is not None and bool(self.visited_mask >> index & 1)
+    
     def _update_target(self) -> None:
         """
         更新目标设施为行程单栈顶
@@ -81,39 +155,48 @@ class Visitor:
         
         return False
     
-    def start_waiting(self) -> None:
+    def start_waiting(self, now: Optional[float] = None) -> None:
         """
         开始等待
+        参数:
+            now: 当前模拟时间（time.monotonic()时钟），为None时自动读取
         """
-        self.status = "等待"
-        self.waiting_start_time = time.time()
+        self.status_code = Status.WAITING
+        self.waiting_start_time = time.monotonic() if now is None else now
     
-    def end_waiting(self) -> float:
+    def end_waiting(self, now: Optional[float] = None) -> float:
         """
         结束等待
+        参数:
+            now: 当前模拟时间，为None时自动读取
         返回:
             等待时间（秒）
         """
-        waiting_time = time.time() - self.waiting_start_time
+        waiting_time = (time.monotonic() if now is None else now) - self.waiting_start_time
         self.total_waiting_time += waiting_time
         return waiting_time
     
-    def start_ride(self) -> None:
+    def start_ride(self, now: Optional[float] = None) -> None:
         """
         开始游玩
+        参数:
+            now: 当前模拟时间，为None时自动读取
         """
-        self.status = "游玩"
-        self.ride_start_time = time.time()
+        self.status_code = Status.RIDING
+        self.ride_start_time = time.monotonic() if now is None else now
     
-    def end_ride(self) -> float:
+    def end_ride(self, now: Optional[float] = None) -> float:
         """
         结束游玩
+        参数:
+            now: 当前模拟时间，为None时自动读取
         返回:
             游玩时间（秒）
         """
-        ride_time = time.time() - self.ride_start_time
+        ride_time = (time.monotonic() if now is None else now) - self.ride_start_time
         self.total_ride_time += ride_time
-        self.visited_facilities.add(self.target_facility)
+        if self.target_facility is not None:
+            self.visited_mask |= 1 << self.facility_index.register(self.target_facility)
         
         # 从行程单栈中弹出已完成的设施
         self.plan_stack.pop()
@@ -123,30 +206,25 @@ class Visitor:
         
         # 如果没有下一个目标，设置状态为完成
         if not self.target_facility:
-            self.status = "完成"
+            self.status_code = Status.DONE
         else:
-            self.status = "自由"
+            self.status_code = Status.FREE
         
         return ride_time
     
-    def get_status_text(self) -> str:
+    def get_status_text(self, status: Optional[int] = None) -> str:
         """
         获取状态文本
+        参数:
+            status: 调用方已读取的状态编码，为None时从结构数组读取
         返回:
             状态文本
         """
-        if self.status == "自由":
-            if self.target_facility:
-                return f"下一站：{self.target_facility}"
-            else:
-                return "行程结束"
-        elif self.status == "等待":
-            return f"等待：{self.target_facility}"
-        elif self.status == "游玩":
-            return f"游玩：{self.target_facility}"
-        elif self.status == "完成":
+        if not self.target_facility:
             return "行程结束"
-        return self.status
+        if status is None:
+            status = self.arrays.status[self.index]
+        return STATUS_TEMPLATES[status].format(self.target_facility)
     
     def has_plan(self) -> bool:
         """
@@ -162,8 +240,7 @@ class Visitor:
         返回:
             剩余行程列表（从栈顶到栈底）
         """
-        # 由于栈的特性，需要反转来得到正确的顺序
-        return list(reversed(self.plan_stack.stack))
+        return list(self.plan_stack)
     
     def to_dict(self) -> Dict[str, any]:
         """
@@ -180,24 +257,38 @@ class Visitor:
             "remaining_plan": self.get_remaining_plan(),
             "total_waiting_time": self.total_waiting_time,
             "total_ride_time": self.total_ride_time,
-            "visited_facilities": list(self.visited_facilities)
+            "visited_facilities": self.facility_index.names(self.visited_mask)
         }
     
-    def get_bubble_text(self) -> str:
+    def get_bubble_text(self, status: Optional[int] = None) -> str:
         """
         获取显示在游客头顶的气泡文本
+        参数:
+            status: 调用方已读取的状态编码，为None时从结构数组读取
         返回:
             气泡文本
         """
-        return self.get_status_text()
+        return self.get_status_text(status)
 
 
 class VisitorGenerator:
     """
     游客生成器，用于批量创建游客
+    生成的游客共用一个结构数组，游客索引即生成顺序
     """
-    def __init__(self):
+    def __init__(self, capacity: int = 256, seed: Optional[int] = None,
+                 facility_index: Optional[FacilityIndex] = None):
+        """
+        初始化游客生成器
+        参数:
+            capacity: 游客结构数组的初始容量
+            seed: 随机数种子，指定后生成的行程可复现
+            facility_index: 生成的游客共用的设施位索引，为None时新建
+        """
         self.next_id = 1
+        self.arrays = VisitorArrays(capacity)
+        self.facility_index = facility_index if facility_index is not None else FacilityIndex()
+        self.rng = random.Random(seed)  # 生成器独立使用的随机数发生器
     
     def generate_visitor(self, x: int, y: int, plan: List[str] = None) -> Visitor:
         """
@@ -209,7 +300,7 @@ class VisitorGenerator:
         返回:
             Visitor对象
         """
-        visitor = Visitor(self.next_id, x, y, plan)
+        visitor = Visitor(self.next_id, x, y, plan, self.arrays, self.facility_index)
         self.next_id += 1
         return visitor
     
@@ -225,16 +316,18 @@ class VisitorGenerator:
         返回:
             游客列表
         """
-        import random
+        rng = self.rng
+        names = tuple(facility_names)  # sample每次都会复制序列，预先转换为元组
         visitors = []
         
+        # 确保plan_length不超过可用设施数量
+        max_plan_length = min(4, len(names))
+        min_plan_length = min(2, max_plan_length)
+        
         for _ in range(count):
-            if facility_names:
-                # 确保plan_length不超过可用设施数量
-                max_plan_length = min(4, len(facility_names))
-                min_plan_length = min(2, max_plan_length)
-                plan_length = random.randint(min_plan_length, max_plan_length)
-                plan = random.sample(facility_names, plan_length)
+            if names:
+                plan_length = rng.randint(min_plan_length, max_plan_length)
+                plan = rng.sample(names, plan_length)
             else:
                 plan = []
             
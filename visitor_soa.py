@@ -0,0 +1,120 @@
+"""
+游客批量移动模块
+作者: 奇趣乐园团队
+创建时间: 2024-01
+功能: 以结构数组（NumPy）形式保存游客位置、状态和目标，一次性推进所有游客的移动
+"""
+import numpy as np
+from enum import IntEnum
+
+
+# 游客移动状态编码
+VISITOR_IDLE = 0  # 不需要移动（等待、游玩、完成或目标不存在）
+VISITOR_MOVING = 1  # 正在前往目标设施
+
+
+class Status(IntEnum):
+    """
+    游客状态编码，结构数组中以int8保存
+    """
+    FREE = 0  # 自由
+    WAITING = 1  # 等待
+    RIDING = 2  # 游玩
+    DONE = 3  # 完成
+
+
+def step_visitors(xy: np.ndarray, tgt: np.ndarray, st: np.ndarray,
+                  out_arrived: np.ndarray) -> np.ndarray:
+    """
+    所有移动中的游客向各自目标移动一步，规则与Visitor.move_towards一致：先x方向，再y方向
+    参数:
+        xy: 游客位置数组，形状(N, 2)，原地更新
+        tgt: 目标位置数组，形状(N, 2)
+        st: 移动状态编码数组，形状(N,)
+        out_arrived: 输出数组，形状(N,)，已位于目标位置的移动中游客为True
+    返回:
+        本次实际移动了的游客掩码
+    """
+    moving = st == VISITOR_MOVING
+    dx = np.sign(tgt[:, 0] - xy[:, 0])
+    dy = np.sign(tgt[:, 1] - xy[:, 1])
+    
+    # x方向已对齐才沿y方向移动；两个方向都对齐即为到达
+    step_y = np.where(dx == 0, dy, 0)
+    np.logical_and(moving, (dx == 0) & (dy == 0), out=out_arrived)
+    
+    xy[:, 0] += dx * moving
+    xy[:, 1] += step_y * moving
+    return moving & ~out_arrived
+
+
+def tick_visitors(arrays: "VisitorArrays", tgt: np.ndarray, st: np.ndarray, now: float,
+                  out_arrived: np.ndarray) -> np.ndarray:
+    """
+    执行一个模拟步内前len(out_arrived)个游客的移动和状态转换：
+    移动中的游客前进一步，到达目标的游客转为等待状态并记录开始等待时间
+    参数:
+        arrays: 游客结构数组，原地更新
+        tgt: 目标位置数组，形状(N, 2)
+        st: 移动状态编码数组，形状(N,)，到达的游客置为VISITOR_IDLE
+        now: 当前时间
+        out_arrived: 输出数组，形状(N,)，本步到达目标的游客为True
+    返回:
+        本次实际移动了的游客掩码
+    """
+    count = len(out_arrived)
+    moved = step_visitors(arrays.xy[:count], tgt[:count], st[:count], out_arrived)
+    arrived = np.flatnonzero(out_arrived)
+    arrays.status[arrived] = Status.WAITING
+    arrays.waiting_since[arrived] = now
+    st[arrived] = VISITOR_IDLE
+    return moved
+
+
+class VisitorArrays:
+    """
+    游客状态的结构数组（SoA），第i行对应索引为i的游客
+    """
+    __slots__ = ("xy", "status", "waiting_since", "size")
+    
+    def __init__(self, capacity: int = 256):
+        """
+        初始化结构数组
+        参数:
+            capacity: 初始容量，不足时自动翻倍
+        """
+        capacity = max(1, capacity)
+        self.xy = np.zeros((capacity, 2), dtype=np.int16)  # 游客坐标(x, y)
+        self.status = np.zeros(capacity, dtype=np.int8)  # 游客状态编码
+        self.waiting_since = np.zeros(capacity)  # 开始等待的时间
+        self.size = 0
+    
+    def allocate(self, x: int, y: int, status: int = Status.FREE) -> int:
+        """
+        为新游客分配一行
+        参数:
+            x: 初始x坐标
+            y: 初始y坐标
+            status: 初始状态编码
+        返回:
+            新游客所在的行索引
+        """
+        index = self.size
+        if index == len(self.status):
+            # 容量不足时翻倍扩容
+            self.xy = np.resize(self.xy, (index * 2, 2))
+            self.status = np.resize(self.status, index * 2)
+            self.waiting_since = np.resize(self.waiting_since, index * 2)
+        self.xy[index] = (x, y)
+        self.status[index] = status
+        self.waiting_since[index] = 0
+        self.size = index + 1
+        return index
+    
+    def __len__(self) -> int:
+        """
+        获取已分配的游客行数
+        返回:
+            游客数量
+        """
+        return self.size
\ No newline at end of file